@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+CyberPH benchmark suite
+Measures encrypt/decrypt throughput, per-file latency, key derivation time
+and peak memory, and writes the results as JSON.
+
+Usage:
+    python benchmarks/run_benchmarks.py --sizes 1K,1M,100M,2G -o results.json
+    python benchmarks/run_benchmarks.py --baseline results.json
+
+Every encrypt/decrypt case runs in a fresh child process so that its peak
+RSS is measured in isolation.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cyberph import engine
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_SIZES = '1K,64K,1M,16M,256M'
+SIZE_UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+BLOCK_SIZE = 1024 * 1024
+
+
+def parse_size(text):
+    """Parse sizes such as 512, 1K, 16M or 2G into bytes"""
+    text = text.strip().upper()
+    if text[-1] in SIZE_UNITS:
+        return int(float(text[:-1]) * SIZE_UNITS[text[-1]])
+    return int(text)
+
+
+def format_size(size):
+    for unit in ('G', 'M', 'K'):
+        if size >= SIZE_UNITS[unit] and size % SIZE_UNITS[unit] == 0:
+            return f"{size // SIZE_UNITS[unit]}{unit}"
+    return str(size)
+
+
+def peak_rss_kb():
+    """Peak resident set size of this process in KB, or None if unavailable"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and KB elsewhere
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def make_input(path, size, data):
+    """Write a benchmark input of the given size, a block at a time"""
+    if data == 'text':
+        line = b'2024-01-01 12:00:00 INFO request handled path=/api/items status=200\n'
+        block = (line * (BLOCK_SIZE // len(line) + 1))[:BLOCK_SIZE]
+    else:
+        block = os.urandom(BLOCK_SIZE)
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining:
+            f.write(block[:min(remaining, BLOCK_SIZE)])
+            remaining -= min(remaining, BLOCK_SIZE)
+
+
+def run_case(case):
+    """Run one encrypt or decrypt case in this process and return its result"""
+    key = case['key'].encode()
+    compress = case['compress']
+    start = time.perf_counter()
+    if case['operation'] == 'encrypt':
+        engine.encrypt_file(case['input'], case['output'], key=key, cipher=case['cipher'],
+                            compress=compress, workers=case['workers'])
+    else:
+        engine.decrypt_file(case['input'], case['output'], key=key, workers=case['workers'])
+    seconds = time.perf_counter() - start
+    return {'seconds': seconds, 'peak_rss_kb': peak_rss_kb()}
+
+
+def run_case_in_child(case):
+    """Run a case in a fresh interpreter so its peak RSS is not polluted"""
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--case', json.dumps(case)],
+        check=True, capture_output=True, text=True)
+    return json.loads(completed.stdout)
+
+
+def bench_kdf(rounds):
+    """Time derive_key, returning the mean seconds per derivation"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        engine.derive_key('benchmark password')
+    return (time.perf_counter() - start) / rounds
+
+
+def run_benchmarks(args):
+    sizes = [parse_size(size) for size in args.sizes.split(',')]
+    ciphers = args.ciphers.split(',')
+    key = engine.generate_key().decode()
+    compress = None if args.compress == 'none' else args.compress
+
+    results = []
+    with tempfile.TemporaryDirectory(dir=args.tmpdir) as tmpdir:
+        for size in sizes:
+            plain = os.path.join(tmpdir, 'input.bin')
+            encrypted = plain + engine.ENCRYPTED_EXTENSION
+            decrypted = os.path.join(tmpdir, 'output.bin')
+            make_input(plain, size, args.data)
+
+            for cipher in ciphers:
+                for workers in args.workers:
+                    for operation, src, dst in (('encrypt', plain, encrypted),
+                                                ('decrypt', encrypted, decrypted)):
+                        case = {'operation': operation, 'input': src, 'output': dst, 'key': key,
+                                'cipher': cipher, 'compress': compress, 'workers': workers}
+                        # Best of N runs: the least disturbed by other load
+                        runs = [run_case_in_child(case) for _ in range(args.repeat)]
+                        best = min(runs, key=lambda run: run['seconds'])
+                        result = {
+                            'operation': operation,
+                            'cipher': cipher,
+                            'size': size,
+                            'workers': workers,
+                            'seconds': round(best['seconds'], 6),
+                            'mb_per_s': round(size / best['seconds'] / 1024 ** 2, 2),
+                            'peak_rss_kb': max((run['peak_rss_kb'] or 0) for run in runs) or None,
+                        }
+                        if operation == 'encrypt':
+                            result['output_size'] = os.path.getsize(encrypted)
+                        results.append(result)
+                        print(f"{operation:7} {cipher:18} {format_size(size):>6} workers={workers:<3} "
+                              f"{result['seconds'] * 1000:10.2f} ms {result['mb_per_s']:10.2f} MB/s "
+                              f"peak RSS {result['peak_rss_kb']} KB", file=sys.stderr)
+            os.remove(plain)
+
+    kdf_seconds = bench_kdf(args.kdf_rounds)
+    print(f"derive_key: {kdf_seconds * 1000:.1f} ms", file=sys.stderr)
+
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'host': {
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+        },
+        'config': {'data': args.data, 'compress': args.compress, 'repeat': args.repeat},
+        'kdf': {'derive_key_seconds': round(kdf_seconds, 6)},
+        'results': results,
+    }
+
+
+def result_id(result):
+    return (result['operation'], result['cipher'], result['size'], result['workers'])
+
+
+def compare_to_baseline(report, baseline, tolerance):
+    """Print throughput changes against a baseline, returning the number of regressions"""
+    baseline_results = {result_id(result): result for result in baseline['results']}
+    regressions = 0
+    for result in report['results']:
+        previous = baseline_results.get(result_id(result))
+        if previous is None:
+            continue
+        change = (result['mb_per_s'] - previous['mb_per_s']) / previous['mb_per_s']
+        flag = ''
+        if change < -tolerance:
+            flag = '  REGRESSION'
+            regressions += 1
+        print(f"{result['operation']:7} {result['cipher']:18} {format_size(result['size']):>6} "
+              f"workers={result['workers']:<3} {previous['mb_per_s']:10.2f} -> "
+              f"{result['mb_per_s']:10.2f} MB/s ({change:+.1%}){flag}")
+
+    previous_kdf = baseline.get('kdf', {}).get('derive_key_seconds')
+    if previous_kdf:
+        current_kdf = report['kdf']['derive_key_seconds']
+        print(f"derive_key {previous_kdf * 1000:.1f} -> {current_kdf * 1000:.1f} ms "
+              f"({(current_kdf - previous_kdf) / previous_kdf:+.1%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CyberPH encrypt/decrypt benchmarks")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help=f"comma-separated file sizes (default: {DEFAULT_SIZES})")
+    parser.add_argument('--ciphers', default=','.join(engine.CIPHERS),
+                        help="comma-separated ciphers to measure")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, engine.DEFAULT_WORKERS],
+                        help="worker thread counts to measure")
+    parser.add_argument('--data', choices=('random', 'text'), default='random',
+                        help="incompressible or log-like input data")
+    parser.add_argument('--compress', choices=('auto', 'zlib', 'none'), default='auto')
+    parser.add_argument('--repeat', type=int, default=3, help="runs per case; the best is kept")
+    parser.add_argument('--kdf-rounds', type=int, default=5)
+    parser.add_argument('--tmpdir', help="directory for the generated inputs")
+    parser.add_argument('-o', '--output', help="write the JSON results here (default: stdout)")
+    parser.add_argument('--baseline', help="compare against a previous JSON results file")
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help="throughput drop reported as a regression (default: 0.10)")
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(json.loads(args.case))))
+        return 0
+
+    args.workers = sorted(set(args.workers))
+    report = run_benchmarks(args)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare_to_baseline(report, baseline, args.tolerance):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,36 @@
+"""
+CyberPH Encryptor/Decryptor engine package.
+Importing this package does not load tkinter; the GUI lives in cyberph.gui.
+"""
+
+from .engine import (
+    CHUNK_SIZE,
+    CIPHER_AUTO,
+    CIPHERS,
+    DEFAULT_CIPHER,
+    DEFAULT_WORKERS,
+    ENCRYPTED_EXTENSION,
+    FORMAT_VERSION,
+    CyberPHError,
+    DecryptionError,
+    OperationCancelled,
+    decrypt_file,
+    decrypt_stream,
+    derive_key,
+    encrypt_file,
+    encrypt_stream,
+    export_key,
+    generate_key,
+    key_fingerprint,
+    load_key,
+    read_file_metadata,
+    select_cipher,
+    verify_file,
+)
+from .batch import BatchSummary, decrypt_files, encrypt_files, verify_files
+from .bundle import BundleReader, create_bundle, extract_bundle, list_bundle, verify_bundle
+from .checkpoint import encrypt_file_resumable
+from .incremental import SyncSummary, sync_tree
+from .keycache import KeyCache
+from .keyring import KeyRing
+from .reader import EncryptedReader, read_range
@@ -0,0 +1,234 @@
+"""
+CyberPH batch processing
+Encrypt or decrypt many files across a process pool, deriving the password
+key once per batch instead of once per file.
+"""
+
+import os
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from . import bundle, checkpoint, compression, engine
+from .keycache import KeyCache
+from .metrics import STAGE_KDF, Metrics, timed
+
+# Per-process options installed by _init_worker
+_worker_options = {}
+# Password keys derived by this worker process. Files from one encrypt batch
+# share a salt, so each worker pays for the key derivation once rather than
+# once per file
+_worker_keys = KeyCache(max_size=64, ttl=float('inf'))
+
+
+class BatchSummary:
+    """Totals and failures for a batch run"""
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.files = 0
+        self.succeeded = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.failures = []
+        self.started = time.time()
+        self.elapsed = 0.0
+
+    def add_result(self, path, bytes_in, bytes_out):
+        self.files += 1
+        self.succeeded += 1
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+
+    def add_failure(self, path, error):
+        self.files += 1
+        self.failures.append({'path': path, 'error': str(error)})
+
+    def finish(self):
+        self.elapsed = time.time() - self.started
+
+    def as_dict(self):
+        return {
+            'operation': self.operation,
+            'files': self.files,
+            'succeeded': self.succeeded,
+            'failed': len(self.failures),
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'elapsed_seconds': round(self.elapsed, 3),
+            'failures': self.failures,
+        }
+
+    def write(self, path):
+        """Write the summary as JSON"""
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+    def __str__(self):
+        return (f"{self.operation}: {self.succeeded}/{self.files} files, "
+                f"{self.bytes_in} bytes in, {self.bytes_out} bytes out, "
+                f"{len(self.failures)} failed in {self.elapsed:.1f}s")
+
+
+def _init_worker(options):
+    _worker_options.clear()
+    _worker_options.update(options)
+    _worker_keys.clear()
+
+
+def _file_metrics():
+    """A Metrics for one file when the batch collects them, else None"""
+    return Metrics() if _worker_options.get('metrics') else None
+
+
+def _encrypt_one(path, output_path):
+    options = _worker_options
+    metrics = _file_metrics()
+    if options['resume']:
+        output_path, metadata = checkpoint.encrypt_file_resumable(
+            path, output_path, password=options['password'], key=options['key'],
+            salt=options['salt'], kdf=options['kdf'], cipher=options['cipher'],
+            compress=options['compress'], workers=options['workers'], metrics=metrics,
+            key_cache=_worker_keys)
+    else:
+        output_path, metadata = engine.encrypt_file(
+            path, output_path, key=options['key'], salt=options['salt'], kdf=options['kdf'],
+            cipher=options['cipher'], compress=options['compress'], workers=options['workers'],
+            metrics=metrics)
+    return (output_path, metadata['file_size'], os.path.getsize(output_path),
+            metrics and metrics.as_dict())
+
+
+def _decrypt_one(path, output_path):
+    options = _worker_options
+    metrics = _file_metrics()
+    output_path, _ = engine.decrypt_file(path, output_path, password=options['password'],
+                                         key=options['key'], keyring=options['keyring'],
+                                         workers=options['workers'], key_cache=_worker_keys,
+                                         metrics=metrics)
+    return (output_path, os.path.getsize(path), os.path.getsize(output_path),
+            metrics and metrics.as_dict())
+
+
+def _verify_one(path, _):
+    options = _worker_options
+    metrics = _file_metrics()
+    credentials = {'password': options['password'], 'key': options['key'],
+                   'keyring': options['keyring'], 'key_cache': _worker_keys}
+    if engine.read_file_metadata(path).get('bundle'):
+        bundle.verify_bundle(path, workers=options['workers'], **credentials)
+    else:
+        engine.verify_file(path, workers=options['workers'], metrics=metrics, **credentials)
+    return None, os.path.getsize(path), 0, metrics and metrics.as_dict()
+
+
+def _check_unique_outputs(items, default_output=None):
+    """Raise CyberPHError if two items would be written to the same output
+
+    Outputs left as None use default_output(path), or are skipped when
+    they depend on the file (decrypted names come from the header).
+    """
+    seen = {}
+    for path, output_path in items:
+        if output_path is None:
+            if default_output is None:
+                continue
+            output_path = default_output(path)
+        name = os.path.normcase(os.path.abspath(output_path))
+        if name in seen:
+            raise engine.CyberPHError(
+                f"{seen[name]} and {path} would both be written to {output_path}")
+        seen[name] = path
+
+
+def _run(operation, func, jobs, options, items, on_result, metrics=None):
+    summary = BatchSummary(operation)
+    # Workers may be other processes, so per-file metrics come back as dicts
+    options = dict(options, metrics=metrics is not None)
+
+    def record(path, result=None, error=None):
+        if error is None:
+            output_path, bytes_in, bytes_out, file_metrics = result
+            summary.add_result(path, bytes_in, bytes_out)
+            if metrics is not None:
+                metrics.merge(file_metrics)
+        else:
+            output_path = None
+            summary.add_failure(path, error)
+        if on_result is not None:
+            on_result(path, output_path, error)
+
+    if jobs <= 1:
+        _init_worker(options)
+        for path, output_path in items:
+            try:
+                record(path, func(path, output_path))
+            except Exception as e:
+                record(path, error=e)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                 initargs=(options,)) as executor:
+            futures = [(path, executor.submit(func, path, output_path))
+                       for path, output_path in items]
+            for path, future in futures:
+                try:
+                    record(path, future.result())
+                except Exception as e:
+                    record(path, error=e)
+
+    summary.finish()
+    return summary
+
+
+def encrypt_files(items, password=None, key=None, salt=None, cipher=engine.DEFAULT_CIPHER,
+                  compress=compression.COMPRESSION_AUTO, jobs=1, workers=1, on_result=None,
+                  kdf=None, metrics=None, resume=False):
+    """Encrypt (path, output_path) pairs on `jobs` processes, returning a BatchSummary
+
+    A password is derived into a key once for the whole batch; every file
+    still gets its own random nonce. key may also be a key already derived
+    from a password with salt and the KDF spec kdf. on_result(path,
+    output_path, error) is called as each file finishes. A Metrics passed
+    as metrics accumulates the per-stage timings of every file. With resume,
+    files are encrypted with checkpoints (see cyberph.checkpoint) and
+    interrupted outputs from an earlier run are continued.
+    """
+    if (password is None) == (key is None):
+        raise ValueError("Exactly one of password or key is required")
+    items = list(items)
+    _check_unique_outputs(items, engine.encrypted_path)
+    if password is not None:
+        with timed(metrics, STAGE_KDF):
+            key, salt = engine.derive_key(password, kdf=kdf)
+    # Resolve 'auto' once here rather than benchmarking in every worker
+    cipher = engine.select_cipher(cipher)
+    # The password only goes to the workers to reopen outputs started under
+    # an earlier batch's salt
+    options = {'key': key, 'salt': salt, 'kdf': kdf, 'cipher': cipher, 'compress': compress,
+               'workers': workers, 'resume': resume, 'password': password if resume else None}
+    return _run('encrypt', _encrypt_one, jobs, options, items, on_result, metrics)
+
+
+def decrypt_files(items, password=None, key=None, keyring=None, jobs=1, workers=1,
+                  on_result=None, metrics=None):
+    """Decrypt (path, output_path) pairs on `jobs` processes, returning a BatchSummary"""
+    if password is None and key is None and keyring is None:
+        raise ValueError("A password, key or keyring is required")
+    items = list(items)
+    _check_unique_outputs(items)
+    options = {'key': key, 'keyring': keyring, 'password': password, 'workers': workers}
+    return _run('decrypt', _decrypt_one, jobs, options, items, on_result, metrics)
+
+
+def verify_files(paths, password=None, key=None, keyring=None, jobs=1, workers=1,
+                 on_result=None, metrics=None):
+    """Authenticate .cyberph files on `jobs` processes without writing any output
+
+    Returns a BatchSummary whose failures list every file that did not
+    verify. on_result(path, None, error) is called as each file finishes.
+    """
+    if password is None and key is None and keyring is None:
+        raise ValueError("A password, key or keyring is required")
+    options = {'key': key, 'keyring': keyring, 'password': password, 'workers': workers}
+    items = [(path, None) for path in paths]
+    return _run('verify', _verify_one, jobs, options, items, on_result, metrics)
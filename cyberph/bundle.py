@@ -0,0 +1,238 @@
+"""
+CyberPH bundles
+Pack many files into one .cyberph container behind a single header and key
+derivation. An encrypted table of contents records each member's path, size
+and offset, so members can be listed or extracted on their own.
+
+Layout: header | member frames ... | sealed table of contents | footer
+"""
+
+import os
+import json
+
+from cryptography.exceptions import InvalidTag
+
+from . import compression, engine
+
+
+class BundleMember:
+    """One file stored in a bundle"""
+
+    def __init__(self, path, size, offset, nonce, compression=None, mtime=None, key_salt=None):
+        self.path = path
+        self.size = size
+        self.offset = offset
+        self.nonce = nonce
+        self.key_salt = key_salt
+        self.compression = compression
+        self.mtime = mtime
+
+    def as_dict(self):
+        return {
+            'path': self.path,
+            'size': self.size,
+            'offset': self.offset,
+            'nonce': self.nonce,
+            'compression': self.compression,
+            'mtime': self.mtime,
+            'key_salt': self.key_salt,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        # The table of contents may come from anyone holding the key, so
+        # member paths are checked again rather than trusted
+        return cls(_archive_name(data['path']), data['size'], data['offset'], data['nonce'],
+                   data.get('compression'), data.get('mtime'), data.get('key_salt'))
+
+
+def _member_cipher(bundle_metadata, metadata_json, key, member):
+    """Chunk cipher for one member: the bundle's cipher with the member's nonce and key salt"""
+    member_metadata = {
+        'cipher': bundle_metadata['cipher'],
+        'nonce': member.nonce,
+        'key_salt': member.key_salt,
+        'chunk_size': bundle_metadata['chunk_size'],
+        'compression': member.compression,
+    }
+    return engine.make_chunk_cipher(member_metadata, metadata_json, key)
+
+
+def _archive_name(path):
+    """Normalise a member path to a relative, forward-slash form"""
+    name = path.replace(os.sep, '/').lstrip('/')
+    parts = [part for part in name.split('/') if part not in ('', '.')]
+    if not parts or '..' in parts:
+        raise engine.CyberPHError(f"Unsafe member path: {path}")
+    return '/'.join(parts)
+
+
+def create_bundle(output_path, items, password=None, key=None, salt=None,
+                  cipher=engine.DEFAULT_CIPHER, compress=compression.COMPRESSION_AUTO,
+                  chunk_size=engine.CHUNK_SIZE, workers=1, on_member=None, kdf=None):
+    """Pack (path, archive_name) items into one bundle, returning its metadata
+
+    The password is derived into a key once for the whole bundle, with the
+    KDF spec kdf (see cyberph.kdf). Every member gets its own nonce prefix,
+    AEAD key salt and compression decision. on_member(path, member) is called after each
+    file is stored. Archive names must be unique.
+    """
+    items = [(path, _archive_name(archive_name)) for path, archive_name in items]
+    seen = set()
+    for path, archive_name in items:
+        if archive_name in seen:
+            raise engine.CyberPHError(f"Duplicate member path in bundle: {archive_name} ({path})")
+        seen.add(archive_name)
+    cipher = engine.select_cipher(cipher)
+    if cipher not in engine.AEAD_CIPHERS:
+        # Fernet cannot bind a chunk to its member, so chunks of one member
+        # could be swapped into another undetected
+        raise ValueError("Bundles need an AEAD cipher (aes-256-gcm or chacha20-poly1305)")
+    if (password is None) == (key is None):
+        raise ValueError("Exactly one of password or key is required")
+    if password is not None:
+        key, salt = engine.derive_key(password, kdf=kdf)
+
+    metadata = engine.new_metadata(os.path.basename(output_path), None, key, salt, cipher,
+                                   None, chunk_size, kdf)
+    del metadata['chunk_index']
+    metadata['bundle'] = True
+
+    members = []
+    with engine.AtomicOutput(output_path) as dst:
+        metadata_json = engine.write_metadata(dst, metadata)
+        payload_start = dst.tell()
+        for path, archive_name in items:
+            member_compress = compression.choose_compression(
+                compress, compression.sample_file(path) if compress == compression.COMPRESSION_AUTO else b'')
+            with open(path, 'rb') as src:
+                stat = os.fstat(src.fileno())
+                member_metadata = engine.new_cipher_metadata(cipher)
+                member = BundleMember(
+                    archive_name, stat.st_size, dst.tell() - payload_start,
+                    member_metadata['nonce'], member_compress, int(stat.st_mtime),
+                    member_metadata['key_salt'])
+                member_cipher = _member_cipher(metadata, metadata_json, key, member)
+                engine.encrypt_chunks(member_cipher, src, dst, chunk_size, workers)
+            members.append(member)
+            if on_member is not None:
+                on_member(path, member)
+
+        toc = json.dumps([member.as_dict() for member in members]).encode()
+        toc_cipher = engine.make_chunk_cipher(metadata, metadata_json, key)
+        engine.write_sealed_trailer(toc_cipher, dst, toc, len(members))
+
+    return metadata
+
+
+class BundleReader:
+    """Read the table of contents of a bundle and extract members on demand"""
+
+    def __init__(self, path, password=None, key=None, keyring=None, key_cache=None):
+        self.file = open(path, 'rb')
+        try:
+            self.metadata, self.metadata_json = engine.read_header(self.file)
+            if not self.metadata.get('bundle'):
+                raise engine.CyberPHError("Not a .cyberph bundle")
+            self.payload_start = self.file.tell()
+            self.key = engine.resolve_key(self.metadata, password, key, keyring, key_cache)
+            toc_cipher = engine.make_chunk_cipher(self.metadata, self.metadata_json, self.key)
+            try:
+                toc, count = engine.read_sealed_trailer(toc_cipher, self.file)
+            except InvalidTag:
+                raise engine.DecryptionError("Bundle table of contents failed authentication")
+            try:
+                self.members = [BundleMember.from_dict(entry)
+                                for entry in json.loads(toc.decode())]
+            except (ValueError, KeyError, TypeError, AttributeError):
+                # Authenticated but malformed: written by something other than create_bundle
+                raise engine.CyberPHError("Bundle table of contents is corrupted")
+            if len(self.members) != count:
+                raise engine.CyberPHError("Bundle table of contents is corrupted")
+            self._by_path = {member.path: member for member in self.members}
+            if len(self._by_path) != len(self.members):
+                raise engine.CyberPHError("Bundle table of contents has duplicate member paths")
+        except Exception:
+            self.file.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def close(self):
+        self.file.close()
+
+    def member(self, path):
+        """Return the member stored under path"""
+        try:
+            return self._by_path[_archive_name(path)]
+        except KeyError:
+            raise engine.CyberPHError(f"No member {path} in bundle")
+
+    def extract_to(self, member, dst, workers=1):
+        """Decrypt one member into the writable stream dst
+
+        Only this member's chunks are read and authenticated.
+        """
+        self.file.seek(self.payload_start + member.offset)
+        member_cipher = _member_cipher(self.metadata, self.metadata_json, self.key, member)
+        try:
+            total = engine.decrypt_chunks(member_cipher, self.file, dst, workers, trailer=True)
+        except InvalidTag:
+            raise engine.DecryptionError(f"Member {member.path} failed authentication")
+        if total != member.size:
+            raise engine.CyberPHError(f"Member {member.path} is {total} bytes, expected {member.size}")
+        return total
+
+    def verify(self, workers=1):
+        """Authenticate every member without writing any output"""
+        for member in self.members:
+            self.extract_to(member, engine.NullOutput(), workers)
+
+    def extract(self, member, output_dir, workers=1):
+        """Extract one member below output_dir, returning its output path"""
+        output_path = os.path.join(output_dir, *member.path.split('/'))
+        root = os.path.realpath(output_dir)
+        if os.path.commonpath([root, os.path.realpath(output_path)]) != root:
+            raise engine.CyberPHError(f"Member path escapes the output directory: {member.path}")
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        with engine.AtomicOutput(output_path) as dst:
+            self.extract_to(member, dst, workers)
+        if member.mtime is not None:
+            os.utime(output_path, (member.mtime, member.mtime))
+        return output_path
+
+
+def list_bundle(path, password=None, key=None, keyring=None):
+    """Return the members of a bundle; only the table of contents is decrypted"""
+    with BundleReader(path, password, key, keyring) as reader:
+        return reader.members
+
+
+def extract_bundle(path, output_dir, members=None, password=None, key=None, keyring=None,
+                   workers=1, on_member=None):
+    """Extract all members, or only the named ones, below output_dir
+
+    Returns the output paths. on_member(member, output_path) is called
+    after each member is written.
+    """
+    outputs = []
+    with BundleReader(path, password, key, keyring) as reader:
+        selected = reader.members if members is None else [reader.member(name) for name in members]
+        for member in selected:
+            output_path = reader.extract(member, output_dir, workers)
+            outputs.append(output_path)
+            if on_member is not None:
+                on_member(member, output_path)
+    return outputs
+
+
+def verify_bundle(path, password=None, key=None, keyring=None, key_cache=None, workers=1):
+    """Authenticate a bundle's table of contents and every member, returning its metadata"""
+    with BundleReader(path, password, key, keyring, key_cache) as reader:
+        reader.verify(workers)
+        return reader.metadata
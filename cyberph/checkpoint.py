@@ -0,0 +1,310 @@
+"""
+CyberPH checkpointed encryption
+Encrypt very large files so that an interrupted run can pick up where it
+stopped instead of starting over.
+
+The output is written to <output>.part as usual. Every so often the .part
+file is fsynced and <output>.checkpoint records how many chunks are safely
+on disk. Running the same encryption again checks that the input, the
+credentials and the partial output still match the checkpoint, truncates
+anything written after it and continues from the next chunk. Only an output
+that is complete and passes verification is renamed into place.
+"""
+
+import os
+import json
+import time
+import zlib
+import hashlib
+
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import InvalidToken
+
+from . import compression, engine
+from .metrics import STAGE_KDF, STAGE_TOTAL, TimedReader, TimedWriter, timed
+
+CHECKPOINT_SUFFIX = '.checkpoint'
+# A checkpoint is written here first, then renamed over the old one
+CHECKPOINT_TEMP_SUFFIX = CHECKPOINT_SUFFIX + '.tmp'
+CHECKPOINT_VERSION = 1
+# Plaintext bytes between checkpoints; each one costs an fsync of the output
+CHECKPOINT_INTERVAL = 64 * engine.CHUNK_SIZE
+_CHECKPOINT_FIELDS = {'version', 'input', 'header_sha256', 'chunks', 'part_size'}
+
+
+def checkpoint_path(output_path):
+    return output_path + CHECKPOINT_SUFFIX
+
+
+def load_checkpoint(path):
+    """Load a checkpoint, or None if there is none or it cannot be used"""
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (not isinstance(state, dict) or not _CHECKPOINT_FIELDS <= state.keys()
+            or state['version'] != CHECKPOINT_VERSION):
+        return None
+    return state
+
+
+def save_checkpoint(path, state):
+    """Durably replace the checkpoint at path
+
+    The directory is not fsynced: if the rename is lost in a crash, the
+    previous checkpoint still describes a prefix of the .part file.
+    """
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def discard_checkpoint(output_path):
+    """Remove the partial output and checkpoint of an interrupted encryption"""
+    for path in (output_path + '.part', checkpoint_path(output_path),
+                 output_path + CHECKPOINT_TEMP_SUFFIX):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _input_state(stat):
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _header_digest(metadata_json):
+    return hashlib.sha256(metadata_json).hexdigest()
+
+
+def _matches(metadata, cipher, compress, chunk_size):
+    """Whether a partial output was started with the requested options"""
+    if cipher != engine.CIPHER_AUTO and metadata.get('cipher') != cipher:
+        return False
+    if compress != compression.COMPRESSION_AUTO and metadata.get('compression') != compress:
+        return False
+    return metadata.get('chunk_size') == chunk_size
+
+
+def _resume_key(metadata, password, key, key_cache):
+    """The key the partial output was written with, or None if not given"""
+    if key is not None:
+        try:
+            engine.check_key(metadata, key)
+            return key
+        except engine.DecryptionError:
+            pass
+    if password is None or metadata.get('encryption_method') != 'password':
+        return None
+    try:
+        return engine.resolve_key(metadata, password=password, key_cache=key_cache)
+    except engine.DecryptionError:
+        return None
+
+
+def _scan_frames(part, header_size, payload_size):
+    """Rebuild the frame offsets of a partial payload, or None if it is damaged"""
+    offsets = []
+    position = 0
+    while position < payload_size:
+        offsets.append(position)
+        # Final frames are never checkpointed
+        if engine.skip_frame(part):
+            return None
+        position = part.tell() - header_size
+    return (offsets, position) if position == payload_size else None
+
+
+def _tail_matches(part, src, chunk_cipher, chunk_size, index):
+    """Whether the frames written after the checkpoint seal the current input
+
+    Those chunks are sealed again under the same nonces when the run
+    resumes, which is only safe if their plaintext is unchanged. The AEAD
+    ciphers are deterministic for a given nonce, so the new frames must
+    repeat the old bytes exactly. A torn last frame is compared as far as
+    it reached the disk.
+    """
+    src.seek(index * chunk_size)
+    for index, final, chunk in engine.iter_chunks(src, chunk_size, index):
+        frame = engine.encode_frame(final, chunk_cipher.encrypt(index, final, chunk))
+        written = part.read(len(frame))
+        if written != frame[:len(written)]:
+            return False
+        if len(written) < len(frame) or final:
+            # Anything after the final frame is the chunk index, which
+            # follows from the frames
+            return True
+    return True
+
+
+def _resume(state, part_path, src, stat, password, key, key_cache, cipher, compress,
+            chunk_size):
+    """Check a checkpoint against the input and partial output
+
+    Returns (metadata, metadata_json, key, offsets, header_size, position)
+    to continue from, or None to start over.
+    """
+    if state.get('input') != _input_state(stat):
+        return None
+    try:
+        part = open(part_path, 'rb')
+    except OSError:
+        return None
+    with part:
+        if os.fstat(part.fileno()).st_size < state['part_size']:
+            return None
+        try:
+            metadata, metadata_json = engine.read_header(part)
+        except (engine.CyberPHError, ValueError):
+            return None
+        header_size = part.tell()
+        if (_header_digest(metadata_json) != state['header_sha256']
+                or metadata.get('file_size') != stat.st_size
+                or not _matches(metadata, cipher, compress, chunk_size)):
+            return None
+        # Chunks are re-encrypted with the nonces they had before, which is
+        # only safe if they seal exactly the same bytes as last time
+        if metadata.get('compression') and state.get('zlib') != zlib.ZLIB_RUNTIME_VERSION:
+            return None
+        key = _resume_key(metadata, password, key, key_cache)
+        if key is None:
+            return None
+
+        try:
+            scanned = _scan_frames(part, header_size, state['part_size'] - header_size)
+        except engine.CyberPHError:
+            return None
+        if scanned is None or len(scanned[0]) != state['chunks']:
+            return None
+        offsets, position = scanned
+        chunk_cipher = engine.make_chunk_cipher(metadata, metadata_json, key)
+        if offsets:
+            # Authenticate the last checkpointed chunk before building on it
+            part.seek(header_size + offsets[-1])
+            try:
+                _, sealed = engine.read_frame(part)
+                chunk_cipher.decrypt(len(offsets) - 1, False, sealed)
+            except (engine.CyberPHError, InvalidTag, InvalidToken, ValueError, zlib.error):
+                return None
+        # Fernet picks a random IV per chunk, so only the AEAD ciphers can
+        # reuse a nonce
+        part.seek(header_size + position)
+        if (metadata.get('cipher') in engine.AEAD_CIPHERS
+                and not _tail_matches(part, src, chunk_cipher, chunk_size, len(offsets))):
+            return None
+    return metadata, metadata_json, key, offsets, header_size, position
+
+
+def encrypt_file_resumable(input_path, output_path=None, password=None, key=None, salt=None,
+                           cipher=engine.DEFAULT_CIPHER, compress=compression.COMPRESSION_AUTO,
+                           chunk_size=engine.CHUNK_SIZE, workers=engine.DEFAULT_WORKERS,
+                           progress=None, cancel=None, kdf=None, metrics=None, key_cache=None,
+                           checkpoint_interval=CHECKPOINT_INTERVAL, verify=True):
+    """Encrypt input_path like engine.encrypt_file, checkpointing as it goes
+
+    If an earlier run for the same output was interrupted, it is resumed
+    from its last checkpoint, provided the input is unchanged (same size and
+    mtime), the options match and the credentials open the partial output.
+    Chunks already written past the checkpoint are sealed again from the
+    current input and must come out identical, so a changed input can never
+    reuse an AEAD nonce. Otherwise the encryption starts over with a fresh
+    header. The checkpointed chunks themselves are not re-read: if the input
+    may have been rewritten in place while keeping its size and mtime,
+    discard the checkpoint (discard_checkpoint) rather than resume. A key and salt from a batch
+    derivation may be passed together with the password; the password is
+    then only used to resume outputs started under a different salt.
+
+    With verify (the default), the finished output is read back and every
+    chunk authenticated before it is renamed into place; a failed check
+    discards the partial output. Cancelling or failing part way leaves the
+    .part and .checkpoint files for the next run. Returns (output_path,
+    metadata).
+    """
+    if password is None and key is None:
+        raise ValueError("A password or key is required")
+    if output_path is None:
+        output_path = engine.encrypted_path(input_path)
+    part_path = output_path + '.part'
+    state_path = checkpoint_path(output_path)
+    start = time.perf_counter()
+
+    with open(input_path, 'rb') as src:
+        stat = os.fstat(src.fileno())
+        state = load_checkpoint(state_path)
+        resumed = state and _resume(state, part_path, src, stat, password, key, key_cache,
+                                    cipher, compress, chunk_size)
+        if resumed:
+            metadata, metadata_json, key, offsets, header_size, position = resumed
+            dst = open(part_path, 'r+b')
+            dst.truncate(header_size + position)
+            dst.seek(header_size + position)
+            src.seek(len(offsets) * chunk_size)
+        else:
+            discard_checkpoint(output_path)
+            src.seek(0)
+            if key is None:
+                with timed(metrics, STAGE_KDF):
+                    key, salt = engine.derive_key(password, kdf=kdf)
+            sample = (compression.sample_file(input_path)
+                      if compress == compression.COMPRESSION_AUTO else b'')
+            metadata = engine.new_metadata(
+                os.path.basename(input_path), stat.st_size, key, salt, cipher,
+                compression.choose_compression(compress, sample), chunk_size, kdf)
+            dst = open(part_path, 'wb')
+            metadata_json = engine.write_metadata(dst, metadata)
+            header_size = dst.tell()
+            offsets, position = [], 0
+
+        saved = {'total': len(offsets) * chunk_size}
+
+        def on_frame(index, final, total, position):
+            if final or total - saved['total'] < checkpoint_interval:
+                return
+            dst.flush()
+            os.fsync(dst.fileno())
+            save_checkpoint(state_path, {
+                'version': CHECKPOINT_VERSION,
+                'input': _input_state(stat),
+                'header_sha256': _header_digest(metadata_json),
+                'zlib': zlib.ZLIB_RUNTIME_VERSION,
+                'chunks': index + 1,
+                'part_size': header_size + position,
+            })
+            saved['total'] = total
+
+        reader, writer = src, dst
+        if metrics is not None:
+            reader, writer = TimedReader(src, metrics), TimedWriter(dst, metrics)
+        chunk_cipher = engine.make_chunk_cipher(metadata, metadata_json, key, metrics)
+        with dst:
+            total = engine.encrypt_chunks(
+                chunk_cipher, reader, writer, metadata['chunk_size'], workers,
+                engine.with_total(progress, stat.st_size), cancel,
+                chunk_index=True, offsets=offsets, total=saved['total'], position=position,
+                on_frame=on_frame)
+            dst.flush()
+            os.fsync(dst.fileno())
+
+    if total != stat.st_size:
+        discard_checkpoint(output_path)
+        raise engine.CyberPHError("File changed while it was being encrypted")
+    if verify:
+        try:
+            engine.verify_file(part_path, key=key, workers=workers, cancel=cancel)
+        except engine.OperationCancelled:
+            raise
+        except engine.CyberPHError:
+            discard_checkpoint(output_path)
+            raise
+    os.replace(part_path, output_path)
+    try:
+        os.remove(state_path)
+    except FileNotFoundError:
+        pass
+    if metrics is not None:
+        metrics.add(STAGE_TOTAL, time.perf_counter() - start, total)
+    return output_path, metadata
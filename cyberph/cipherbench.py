@@ -0,0 +1,117 @@
+"""
+CyberPH cipher selection
+Micro-benchmark the AEAD ciphers on this host and remember the fastest.
+AES-GCM wins by a wide margin on CPUs with AES instructions, while
+ChaCha20-Poly1305 is usually faster on CPUs without them.
+
+The result is cached per host in a small JSON file and reused until the
+host, Python or the crypto library changes.
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+
+import cryptography
+from cryptography.hazmat.backends.openssl.backend import backend
+
+CACHE_DIR_ENV = 'CYBERPH_CACHE_DIR'
+CACHE_FILENAME = 'cipher-benchmark.json'
+BENCHMARK_SIZE = 1024 * 1024
+BENCHMARK_SECONDS = 0.1
+
+# Results measured by this process, keyed by cache path
+_results = {}
+
+
+def cache_path():
+    """Per-user cache file for benchmark results"""
+    directory = os.environ.get(CACHE_DIR_ENV)
+    if directory is None:
+        if sys.platform == 'win32':
+            base = os.environ.get('LOCALAPPDATA', os.path.expanduser('~'))
+        else:
+            base = os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache'))
+        directory = os.path.join(base, 'cyberph')
+    return os.path.join(directory, CACHE_FILENAME)
+
+
+def host_id():
+    """Identify the host and crypto stack a benchmark result is valid for"""
+    return {
+        'node': platform.node(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'python': platform.python_version(),
+        'cryptography': cryptography.__version__,
+        'openssl': backend.openssl_version_text(),
+    }
+
+
+def benchmark(aeads, size=BENCHMARK_SIZE, seconds=BENCHMARK_SECONDS):
+    """Measure encryption throughput in bytes/second for each {name: AEAD class}
+
+    Each cipher seals size-byte chunks, like the engine does, for at least
+    `seconds`.
+    """
+    data = os.urandom(size)
+    nonce = os.urandom(12)
+    results = {}
+    for name, aead_class in aeads.items():
+        aead = aead_class(os.urandom(32))
+        aead.encrypt(nonce, data, None)  # warm up
+        rounds = 0
+        start = time.perf_counter()
+        while True:
+            aead.encrypt(nonce, data, None)
+            rounds += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= seconds:
+                break
+        results[name] = rounds * size / elapsed
+    return results
+
+
+def _load(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save(path, cached):
+    # The cache is an optimisation: a read-only home directory is not an error
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.part', 'w') as f:
+            json.dump(cached, f, indent=2)
+        os.replace(path + '.part', path)
+    except OSError:
+        pass
+
+
+def measure(aeads, refresh=False, path=None):
+    """Return {name: bytes/second}, from the host cache unless refresh is set"""
+    path = path or cache_path()
+    if not refresh:
+        if path in _results and _results[path].keys() == aeads.keys():
+            return _results[path]
+        cached = _load(path)
+        if (cached is not None and cached.get('host') == host_id()
+                and cached.get('results', {}).keys() == aeads.keys()):
+            _results[path] = cached['results']
+            return _results[path]
+
+    results = benchmark(aeads)
+    _results[path] = results
+    _save(path, {'host': host_id(), 'results': results})
+    return results
+
+
+def fastest(aeads, refresh=False, path=None):
+    """Name of the fastest cipher of {name: AEAD class} on this host"""
+    results = measure(aeads, refresh, path)
+    return max(results, key=results.get)
@@ -0,0 +1,508 @@
+"""
+CyberPH command-line interface
+Headless encrypt/decrypt for servers and scripts. Does not import tkinter.
+"""
+
+import os
+import sys
+import signal
+import argparse
+import getpass
+
+from . import batch, bundle, checkpoint, engine, incremental, kdf, watch
+from .keyring import KeyRing
+from .metrics import Metrics
+from .reader import EncryptedReader
+
+PASSWORD_ENV = 'CYBERPH_PASSWORD'
+# Passing '-' as the only path streams stdin to stdout
+PIPE_PATH = '-'
+INTERRUPTED_SUFFIXES = tuple(engine.ENCRYPTED_EXTENSION + suffix
+                             for suffix in ('.part', checkpoint.CHECKPOINT_SUFFIX,
+                                            checkpoint.CHECKPOINT_TEMP_SUFFIX))
+CIPHER_HELP = (f"payload cipher; '{engine.CIPHER_AUTO}' picks the fastest AEAD cipher on this "
+               f"host (default: {engine.DEFAULT_CIPHER})")
+
+
+def iter_input_files(paths, encrypted):
+    """Yield (path, relative_path) for files named directly or found in directories
+
+    Directories are walked recursively; only .cyberph files are picked up when
+    `encrypted` is true, and .cyberph files are skipped otherwise.
+    """
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path, os.path.basename(path)
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if name.endswith(engine.ENCRYPTED_EXTENSION) != encrypted:
+                    continue
+                if name.endswith(INTERRUPTED_SUFFIXES):
+                    # Leftovers of an interrupted encrypt --resume
+                    continue
+                full_path = os.path.join(dirpath, name)
+                yield full_path, os.path.relpath(full_path, path)
+
+
+def output_path_for(relative_path, output_dir, encrypt):
+    """Map a relative input path into output_dir, or None for the default location"""
+    if output_dir is None:
+        return None
+    if encrypt:
+        relative_path += engine.ENCRYPTED_EXTENSION
+    elif relative_path.endswith(engine.ENCRYPTED_EXTENSION):
+        relative_path = relative_path[:-len(engine.ENCRYPTED_EXTENSION)]
+    output_path = os.path.join(output_dir, relative_path)
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    return output_path
+
+
+def read_password(args, confirm=False):
+    """Read the password from a file descriptor, environment variable or the terminal"""
+    if args.password_fd is not None:
+        with os.fdopen(args.password_fd, 'r') as f:
+            password = f.readline().rstrip('\r\n')
+    elif args.password_env is not None:
+        password = os.environ.get(args.password_env)
+        if password is None:
+            raise SystemExit(f"Environment variable {args.password_env} is not set")
+    elif PASSWORD_ENV in os.environ:
+        password = os.environ[PASSWORD_ENV]
+    elif sys.stdin.isatty():
+        password = getpass.getpass("Password: ")
+        if confirm and password != getpass.getpass("Confirm password: "):
+            raise SystemExit("Passwords do not match!")
+    else:
+        raise SystemExit("No password given: use --password-env, --password-fd or --key-file")
+
+    if not password:
+        raise SystemExit("Password must not be empty")
+    return password
+
+
+def read_credentials(args, confirm=False):
+    """Return (password, key) for the credential options in args"""
+    if args.key_file:
+        return None, engine.load_key(args.key_file)
+    return read_password(args, confirm), None
+
+
+def load_keyring(paths):
+    """Load every key file or key directory in paths into one KeyRing"""
+    keyring = KeyRing()
+    for path in paths:
+        keyring.load(path)
+    return keyring
+
+
+def read_decrypt_credentials(args):
+    """Return (password, key, keyring) for decrypting with the options in args"""
+    if args.keyring:
+        return None, None, load_keyring(args.keyring)
+    password, key = read_credentials(args)
+    return password, key, None
+
+
+def kdf_spec(args):
+    """Return the KDF spec for --kdf/--kdf-time, calibrating on this machine if asked"""
+    if args.kdf_time is None:
+        return kdf.normalize(args.kdf) if args.kdf else None
+    spec = kdf.calibrate(args.kdf or kdf.DEFAULT_KDF['name'], args.kdf_time)
+    print(f"Calibrated KDF: {spec}", file=sys.stderr)
+    return spec
+
+
+def new_metrics(args, operation):
+    """A Metrics for --metrics, or None when metrics are not requested"""
+    return Metrics(operation) if args.metrics else None
+
+
+def write_metrics(args, metrics):
+    """Export metrics as a Prometheus text file (*.prom) or append a JSON line"""
+    if metrics is None:
+        return
+    if args.metrics_format == 'prometheus' or (args.metrics_format is None
+                                               and args.metrics.endswith('.prom')):
+        metrics.write_prometheus(args.metrics)
+    else:
+        metrics.append_jsonl(args.metrics)
+
+
+def report_result(path, output_path, error):
+    if error is None:
+        print(f"{path} -> {output_path}")
+    else:
+        print(f"Failed: {path}: {error}", file=sys.stderr)
+
+
+def finish_batch(args, summary):
+    print(summary, file=sys.stderr)
+    if args.summary:
+        summary.write(args.summary)
+    return 1 if summary.failures else 0
+
+
+def thread_workers(args):
+    """Threads per file: all cores for one process, otherwise one per process"""
+    if args.workers is not None:
+        return args.workers
+    return engine.DEFAULT_WORKERS if args.jobs <= 1 else 1
+
+
+def stdout_closed():
+    """Exit quietly when the reader of stdout goes away, e.g. `| head`"""
+    # Python would otherwise complain again while flushing stdout at exit
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, sys.stdout.fileno())
+    return 1
+
+
+def is_pipe(args):
+    """True when the only path is '-': read stdin and write stdout"""
+    return args.paths == [PIPE_PATH]
+
+
+def cmd_encrypt(args):
+    password, key = read_credentials(args, confirm=True)
+    compress = None if args.compress == 'none' else args.compress
+    metrics = new_metrics(args, 'encrypt')
+    if is_pipe(args):
+        if args.resume:
+            raise SystemExit("--resume needs input files; it cannot resume a pipe")
+        try:
+            engine.encrypt_stream(sys.stdin.buffer, sys.stdout.buffer, password=password,
+                                  key=key, cipher=args.cipher, compress=compress,
+                                  workers=thread_workers(args), original_filename=args.name,
+                                  kdf=kdf_spec(args) if password is not None else None,
+                                  metrics=metrics)
+            sys.stdout.buffer.flush()
+        except BrokenPipeError:
+            return stdout_closed()
+        write_metrics(args, metrics)
+        return 0
+
+    items = [(path, output_path_for(relative_path, args.output_dir, encrypt=True))
+             for path, relative_path in iter_input_files(args.paths, encrypted=False)]
+    summary = batch.encrypt_files(items, password=password, key=key, cipher=args.cipher,
+                                  compress=compress,
+                                  jobs=args.jobs, workers=thread_workers(args),
+                                  on_result=report_result,
+                                  kdf=kdf_spec(args) if password is not None else None,
+                                  metrics=metrics, resume=args.resume)
+    write_metrics(args, metrics)
+    return finish_batch(args, summary)
+
+
+def cmd_decrypt(args):
+    password, key, keyring = read_decrypt_credentials(args)
+    metrics = new_metrics(args, 'decrypt')
+    if is_pipe(args):
+        written = {'bytes': 0}
+        try:
+            engine.decrypt_stream(sys.stdin.buffer, sys.stdout.buffer, password=password,
+                                  key=key, keyring=keyring, workers=thread_workers(args),
+                                  progress=lambda done, total: written.update(bytes=done),
+                                  metrics=metrics)
+            sys.stdout.buffer.flush()
+        except BrokenPipeError:
+            return stdout_closed()
+        except engine.CyberPHError:
+            if written['bytes']:
+                print(f"Only {written['bytes']} bytes were decrypted; the output already "
+                      f"written is incomplete", file=sys.stderr)
+            raise
+        write_metrics(args, metrics)
+        return 0
+
+    items = [(path, output_path_for(relative_path, args.output_dir, encrypt=False))
+             for path, relative_path in iter_input_files(args.paths, encrypted=True)]
+    summary = batch.decrypt_files(items, password=password, key=key, keyring=keyring,
+                                  jobs=args.jobs, workers=thread_workers(args),
+                                  on_result=report_result, metrics=metrics)
+    write_metrics(args, metrics)
+    return finish_batch(args, summary)
+
+
+def cmd_verify(args):
+    password, key, keyring = read_decrypt_credentials(args)
+    metrics = new_metrics(args, 'verify')
+
+    def report_verified(path, _, error):
+        if error is None:
+            print(f"OK      {path}")
+        else:
+            print(f"FAILED  {path}: {error}")
+
+    paths = [path for path, _ in iter_input_files(args.paths, encrypted=True)]
+    summary = batch.verify_files(paths, password=password, key=key, keyring=keyring,
+                                 jobs=args.jobs, workers=thread_workers(args),
+                                 on_result=report_verified, metrics=metrics)
+    write_metrics(args, metrics)
+    return finish_batch(args, summary)
+
+
+def cmd_read(args):
+    password, key, keyring = read_decrypt_credentials(args)
+
+    with EncryptedReader(args.path, password, key, keyring) as reader:
+        # Opened only once the key is known to be right, so a failure does
+        # not leave an empty output file behind
+        output = open(args.output, 'wb') if args.output else sys.stdout.buffer
+        try:
+            for data in reader.iter_range(args.offset, args.length):
+                output.write(data)
+        finally:
+            if args.output:
+                output.close()
+    return 0
+
+
+def cmd_sync(args):
+    password, key = read_credentials(args, confirm=True)
+    compress = None if args.compress == 'none' else args.compress
+    metrics = new_metrics(args, 'sync')
+    summary = incremental.sync_tree(args.source, args.output_dir, password=password, key=key,
+                                    cipher=args.cipher, compress=compress,
+                                    jobs=args.jobs, workers=thread_workers(args),
+                                    on_result=report_result,
+                                    on_removed=lambda output_path: print(f"Removed {output_path}"),
+                                    kdf=args.kdf, kdf_time=args.kdf_time, metrics=metrics)
+    write_metrics(args, metrics)
+    return finish_batch(args, summary)
+
+
+def cmd_pack(args):
+    password, key = read_credentials(args, confirm=True)
+    compress = None if args.compress == 'none' else args.compress
+    items = list(iter_input_files(args.paths, encrypted=False))
+    bundle.create_bundle(args.output, items, password=password, key=key, cipher=args.cipher,
+                         compress=compress, workers=args.workers or engine.DEFAULT_WORKERS,
+                         on_member=lambda path, member: print(f"{path} -> {member.path}"),
+                         kdf=kdf_spec(args) if password is not None else None)
+    print(f"Packed {len(items)} files into {args.output}", file=sys.stderr)
+    return 0
+
+
+def cmd_list(args):
+    password, key, keyring = read_decrypt_credentials(args)
+    for member in bundle.list_bundle(args.path, password, key, keyring):
+        print(f"{member.size:>12}  {member.path}")
+    return 0
+
+
+def cmd_unpack(args):
+    password, key, keyring = read_decrypt_credentials(args)
+    bundle.extract_bundle(args.path, args.output_dir, args.members or None,
+                          password=password, key=key, keyring=keyring,
+                          workers=args.workers or engine.DEFAULT_WORKERS,
+                          on_member=lambda member, output_path: print(f"{member.path} -> {output_path}"))
+    return 0
+
+
+def cmd_watch(args):
+    def report_event(kind, path, detail):
+        if kind == 'encrypted':
+            print(f"{path} -> {detail}", flush=True)
+        elif kind in ('retry', 'failed'):
+            print(f"{kind.capitalize()}: {path}: {detail}", file=sys.stderr, flush=True)
+
+    watcher = watch.FolderWatcher(
+        args.inbox, args.output_dir, engine.load_key(args.key_file),
+        after=watch.AFTER_MOVE if args.done_dir else watch.AFTER_REMOVE,
+        done_dir=args.done_dir, failed_dir=args.failed_dir, jobs=args.jobs,
+        queue_size=args.queue_size, poll_interval=args.poll_interval,
+        settle_time=args.settle_time, max_attempts=args.attempts,
+        retry_delay=args.retry_delay, cipher=args.cipher, on_event=report_event)
+
+    def shutdown(signum, frame):
+        print("Stopping after the files in progress...", file=sys.stderr, flush=True)
+        watcher.stop()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+    print(f"Watching {args.inbox}", file=sys.stderr, flush=True)
+    watcher.run()
+    return 0
+
+
+def cmd_cipher_bench(args):
+    results = engine.benchmark_ciphers(refresh=args.refresh)
+    for cipher, speed in sorted(results.items(), key=lambda item: -item[1]):
+        print(f"{cipher:<24} {speed / 1024 ** 2:10.1f} MB/s")
+    print(f"Fastest: {max(results, key=results.get)}")
+    return 0
+
+
+def cmd_genkey(args):
+    raw_key_path = engine.export_key(engine.generate_key(), args.output)
+    print(f"Key exported to: {args.output}")
+    print(f"Raw key saved to: {raw_key_path}")
+    return 0
+
+
+def add_credential_arguments(parser):
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--key-file', help="use an exported key file instead of a password")
+    group.add_argument('--password-env', metavar='VAR',
+                       help=f"read the password from environment variable VAR (default: {PASSWORD_ENV})")
+    group.add_argument('--password-fd', metavar='FD', type=int,
+                       help="read the password from the first line of file descriptor FD")
+    return group
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='cyberph',
+        description="CyberPH Encryptor/Decryptor. Run without arguments to start the GUI.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    encrypt = subparsers.add_parser('encrypt', help="encrypt files and directories, or - for stdin to stdout")
+    encrypt.add_argument('paths', nargs='+', metavar='PATH')
+    encrypt.add_argument('--cipher', choices=engine.CIPHER_CHOICES, default=engine.DEFAULT_CIPHER,
+                         help=CIPHER_HELP)
+    encrypt.add_argument('--compress', choices=('auto', 'zlib', 'none'), default='auto',
+                         help="compress before encrypting; 'auto' skips inputs that look "
+                              "already compressed (default: auto)")
+    encrypt.add_argument('--name', default='stdin',
+                         help="original filename recorded when encrypting from stdin")
+    encrypt.add_argument('--resume', action='store_true',
+                         help="checkpoint progress so an interrupted run continues where it "
+                              "stopped when the same command is run again")
+    add_credential_arguments(encrypt)
+    encrypt.set_defaults(func=cmd_encrypt)
+
+    decrypt = subparsers.add_parser('decrypt', help="decrypt .cyberph files and directories, or - for stdin to stdout")
+    decrypt.add_argument('paths', nargs='+', metavar='PATH')
+    decrypt.set_defaults(func=cmd_decrypt)
+
+    verify = subparsers.add_parser('verify', help="authenticate .cyberph files and directories "
+                                                  "without writing any output")
+    verify.add_argument('paths', nargs='+', metavar='PATH')
+    verify.set_defaults(func=cmd_verify)
+
+    read = subparsers.add_parser('read', help="decrypt a byte range of a .cyberph file to stdout")
+    read.add_argument('path', metavar='PATH')
+    read.add_argument('--offset', type=int, default=0, help="first plaintext byte (default: 0)")
+    read.add_argument('--length', type=int, help="bytes to read (default: to the end)")
+    read.add_argument('-o', '--output', help="write to this file instead of stdout")
+    read.set_defaults(func=cmd_read)
+
+    sync = subparsers.add_parser('sync', help="incrementally encrypt a directory tree, re-encrypting "
+                                              "only added or changed files")
+    sync.add_argument('source', help="plaintext directory")
+    sync.add_argument('output_dir', help="encrypted mirror; holds the change manifest")
+    sync.add_argument('--cipher', choices=engine.CIPHER_CHOICES, default=engine.DEFAULT_CIPHER,
+                         help=CIPHER_HELP)
+    sync.add_argument('--compress', choices=('auto', 'zlib', 'none'), default='auto')
+    sync.add_argument('-j', '--jobs', type=int, default=1,
+                      help="files processed in parallel by a process pool (default: 1)")
+    sync.add_argument('--workers', type=int,
+                      help="threads used per file (default: CPU count with one job, else 1)")
+    sync.add_argument('--summary', metavar='FILE',
+                      help="write a JSON summary of files, bytes and failures")
+    add_credential_arguments(sync)
+    sync.set_defaults(func=cmd_sync)
+
+    pack = subparsers.add_parser('pack', help="encrypt many files into one .cyberph bundle")
+    pack.add_argument('output', help="bundle file to write")
+    pack.add_argument('paths', nargs='+', metavar='PATH')
+    pack.add_argument('--cipher', choices=engine.AEAD_CIPHERS + (engine.CIPHER_AUTO,),
+                      default=engine.DEFAULT_CIPHER, help=CIPHER_HELP)
+    pack.add_argument('--compress', choices=('auto', 'zlib', 'none'), default='auto')
+    add_credential_arguments(pack)
+    pack.set_defaults(func=cmd_pack)
+
+    list_ = subparsers.add_parser('list', help="list the members of a bundle")
+    list_.add_argument('path', metavar='BUNDLE')
+    list_.set_defaults(func=cmd_list)
+
+    unpack = subparsers.add_parser('unpack', help="extract all or some members of a bundle")
+    unpack.add_argument('path', metavar='BUNDLE')
+    unpack.add_argument('members', nargs='*', metavar='MEMBER',
+                        help="member paths to extract (default: all)")
+    unpack.add_argument('-o', '--output-dir', default='.',
+                        help="directory to extract into (default: current directory)")
+    unpack.set_defaults(func=cmd_unpack)
+
+    for subparser in (encrypt, decrypt, verify, sync):
+        subparser.add_argument('--metrics', metavar='FILE',
+                               help="record per-stage timings (read, kdf, compress, cipher, "
+                                    "write) to FILE")
+        subparser.add_argument('--metrics-format', choices=('jsonl', 'prometheus'),
+                               help="append a JSON line, or write a Prometheus text file "
+                                    "(default: prometheus for *.prom, else jsonl)")
+
+    for subparser in (encrypt, sync, pack):
+        subparser.add_argument('--kdf', choices=kdf.available_kdfs(),
+                               help=f"password key derivation function (default: {kdf.DEFAULT_KDF['name']})")
+        subparser.add_argument('--kdf-time', type=float, metavar='SECONDS',
+                               help="calibrate the KDF to take about this long on this machine")
+
+    for subparser in (pack, unpack):
+        subparser.add_argument('--workers', type=int,
+                               help="threads used per file (default: CPU count)")
+
+    for subparser in (decrypt, verify, read, list_, unpack):
+        credentials = add_credential_arguments(subparser)
+        credentials.add_argument('--keyring', action='append', metavar='PATH',
+                                 help="key file or directory of *.key files; the key for "
+                                      "each file is picked by fingerprint (repeatable)")
+
+    for subparser in (encrypt, decrypt):
+        subparser.add_argument('-o', '--output-dir',
+                               help="write outputs here, mirroring input directories")
+
+    for subparser in (encrypt, decrypt, verify):
+        subparser.add_argument('-j', '--jobs', type=int, default=1,
+                               help="files processed in parallel by a process pool (default: 1)")
+        subparser.add_argument('--workers', type=int,
+                               help="threads used per file (default: CPU count with one job, else 1)")
+        subparser.add_argument('--summary', metavar='FILE',
+                               help="write a JSON summary of files, bytes and failures")
+
+    watch_ = subparsers.add_parser('watch', help="encrypt files dropped into an inbox directory "
+                                                 "until stopped (Ctrl+C or SIGTERM)")
+    watch_.add_argument('inbox', help="directory to watch")
+    watch_.add_argument('-o', '--output-dir', required=True, help="where encrypted files go")
+    watch_.add_argument('--key-file', required=True, help="exported key to encrypt with")
+    watch_.add_argument('--done-dir',
+                        help="move plaintext here after encryption (default: delete it)")
+    watch_.add_argument('--failed-dir', help="move files here once all attempts have failed")
+    watch_.add_argument('--cipher', choices=engine.CIPHER_CHOICES, default=engine.DEFAULT_CIPHER,
+                         help=CIPHER_HELP)
+    watch_.add_argument('-j', '--jobs', type=int, default=2,
+                        help="files encrypted at once (default: 2)")
+    watch_.add_argument('--queue-size', type=int, default=16,
+                        help="ready files queued before the scanner waits (default: 16)")
+    watch_.add_argument('--poll-interval', type=float, default=1.0, metavar='SECONDS')
+    watch_.add_argument('--settle-time', type=float, default=2.0, metavar='SECONDS',
+                        help="how long a file must stay unchanged before it is encrypted")
+    watch_.add_argument('--attempts', type=int, default=3,
+                        help="attempts per file before giving up (default: 3)")
+    watch_.add_argument('--retry-delay', type=float, default=10.0, metavar='SECONDS')
+    watch_.set_defaults(func=cmd_watch)
+
+    cipher_bench = subparsers.add_parser('cipher-bench', help="show the cached cipher benchmark "
+                                         "used by --cipher auto")
+    cipher_bench.add_argument('--refresh', action='store_true',
+                              help="measure again instead of using the cached result")
+    cipher_bench.set_defaults(func=cmd_cipher_bench)
+
+    genkey = subparsers.add_parser('genkey', help="generate and export a new encryption key")
+    genkey.add_argument('output', help="key file to write (a _raw.key copy is written too)")
+    genkey.set_defaults(func=cmd_genkey)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except (engine.CyberPHError, ValueError, OSError) as e:
+        # Wrong passwords, corrupt files and missing paths are expected;
+        # report them in one line rather than as a traceback
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
@@ -0,0 +1,846 @@
+"""
+CyberPH encryption engine
+GUI-free encrypt/decrypt functions and the .cyberph container format.
+"""
+
+import os
+import json
+import base64
+import hmac
+import struct
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+
+from . import cipherbench, compression
+from .metrics import STAGE_CIPHER, STAGE_KDF, STAGE_TOTAL, timed
+from .metrics import TimedChunkCipher, TimedReader, TimedWriter
+from .kdf import LEGACY_KDF, derive as kdf_derive, normalize as normalize_kdf
+
+ENCRYPTED_EXTENSION = '.cyberph'
+
+# .cyberph v2: the payload is a sequence of independently encrypted chunks so
+# that files of any size can be processed with bounded memory.
+FORMAT_VERSION = '2.1'
+CHUNK_SIZE = 1024 * 1024
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+# Payload ciphers. Fernet tokens are base64 text; the AEAD ciphers store raw
+# ciphertext bytes and avoid the ~33% size overhead.
+CIPHER_FERNET = 'fernet'
+CIPHER_AES_GCM = 'aes-256-gcm'
+CIPHER_CHACHA20 = 'chacha20-poly1305'
+CIPHERS = (CIPHER_AES_GCM, CIPHER_CHACHA20, CIPHER_FERNET)
+AEAD_CIPHERS = (CIPHER_AES_GCM, CIPHER_CHACHA20)
+DEFAULT_CIPHER = CIPHER_AES_GCM
+# Pick the fastest AEAD on this host by micro-benchmark (cached per host)
+CIPHER_AUTO = 'auto'
+CIPHER_CHOICES = CIPHERS + (CIPHER_AUTO,)
+_AEAD_CLASSES = {CIPHER_AES_GCM: AESGCM, CIPHER_CHACHA20: ChaCha20Poly1305}
+
+# Each frame is a 4-byte big-endian length; the high bit marks the final frame
+_FRAME_HEADER = struct.Struct('>I')
+_FRAME_FINAL = 0x80000000
+# Fernet chunk plaintext is prefixed with its index and final flag so that
+# reordered, dropped or truncated chunks fail authentication
+_CHUNK_PREFIX = struct.Struct('>IB')
+# AEAD nonces are a random per-file prefix followed by the chunk index and
+# final flag, which gives the same guarantees without any per-chunk overhead
+_NONCE_PREFIX_SIZE = 7
+_NONCE_SUFFIX = struct.Struct('>IB')
+# Since format 2.1 each file also has a random salt for the AEAD key
+# derivation, so files under one key never share an AEAD key and a nonce
+# prefix collision between them is harmless
+_KEY_SALT_SIZE = 16
+# The chunk index is sealed like a chunk numbered after the final one, with
+# its own flag value so it can never be mistaken for payload
+_INDEX_FLAG = 2
+# The index trailer ends the file: total plaintext size, then one payload
+# offset per chunk, followed by a footer of (sealed index length, chunk count)
+_INDEX_TOTAL = struct.Struct('>Q')
+_INDEX_OFFSET = struct.Struct('>Q')
+_INDEX_FOOTER = struct.Struct('>QQ')
+
+
+class CyberPHError(Exception):
+    """Base class for errors raised by the engine"""
+
+
+class DecryptionError(CyberPHError):
+    """Wrong password or key, or the encrypted file has been tampered with"""
+
+
+class OperationCancelled(CyberPHError):
+    """The operation was cancelled before it finished"""
+
+
+def derive_key(password, salt=None, kdf=None):
+    """Generate encryption key from password, returning (key, salt)
+
+    kdf is a KDF spec or name from cyberph.kdf; the default is PBKDF2-SHA256
+    with 100,000 iterations, as used by files without a 'kdf' header field.
+    """
+    if salt is None:
+        salt = os.urandom(16)
+
+    key = base64.urlsafe_b64encode(kdf_derive(password, salt, kdf or LEGACY_KDF))
+    return key, salt
+
+
+def key_check_value(key):
+    """Return a short value derived from key, stored in the header to detect wrong keys"""
+    hkdf = HKDF(
+        algorithm=hashes.SHA256(),
+        length=16,
+        salt=None,
+        info=b'cyberph-v2 key-check',
+    )
+    return base64.b64encode(hkdf.derive(base64.urlsafe_b64decode(key))).decode()
+
+
+def key_fingerprint(key):
+    """Return the public fingerprint of an encryption key, as hex"""
+    hkdf = HKDF(
+        algorithm=hashes.SHA256(),
+        length=16,
+        salt=None,
+        info=b'cyberph-v2 fingerprint',
+    )
+    return hkdf.derive(base64.urlsafe_b64decode(key)).hex()
+
+
+def check_key(metadata, key):
+    """Raise DecryptionError if key does not match the header's key check value
+
+    This runs straight after the key derivation, so a wrong password or key
+    is rejected before any of the payload is read. Files written before key
+    check values were introduced are accepted here and fail on the payload.
+    """
+    expected = metadata.get('key_check')
+    if expected is not None and not hmac.compare_digest(expected, key_check_value(key)):
+        raise DecryptionError("Wrong password or key")
+
+
+def generate_key():
+    """Generate a new random encryption key"""
+    return Fernet.generate_key()
+
+
+def validate_key(key_data):
+    """Return key_data if it is a valid encryption key, else raise ValueError"""
+    try:
+        Fernet(key_data)
+    except Exception:
+        raise ValueError("Invalid key format")
+    return key_data
+
+
+def load_key(path):
+    """Load a key from an exported JSON key file or a raw key file"""
+    with open(path, 'rb') as f:
+        key_data = f.read().strip()
+
+    if key_data.startswith(b'{'):
+        try:
+            key_data = json.loads(key_data.decode())['key'].encode()
+        except (ValueError, KeyError, TypeError):
+            raise ValueError("Invalid key file")
+    return validate_key(key_data)
+
+
+def export_key(key, path):
+    """Save key as a JSON key file plus a raw key file, returning the raw path"""
+    key_data = {
+        'key': key.decode(),
+        'generated': datetime.now().isoformat(),
+        'version': '1.0',
+        'application': 'CyberPH Encryptor'
+    }
+
+    with open(path, 'w') as f:
+        json.dump(key_data, f, indent=2)
+
+    raw_key_path = path.replace('.key', '_raw.key')
+    with open(raw_key_path, 'wb') as f:
+        f.write(key)
+    return raw_key_path
+
+
+def write_metadata(file, metadata):
+    """Write the length-prefixed JSON metadata header, returning its bytes"""
+    metadata_json = json.dumps(metadata).encode()
+    file.write(len(metadata_json).to_bytes(4, 'big'))
+    file.write(metadata_json)
+    return metadata_json
+
+
+def read_header(file):
+    """Read the length-prefixed JSON metadata header and its raw bytes"""
+    metadata_length = int.from_bytes(read_full(file, 4), 'big')
+    metadata_json = read_full(file, metadata_length)
+    try:
+        return json.loads(metadata_json.decode()), metadata_json
+    except ValueError:
+        raise CyberPHError("Not a valid .cyberph file")
+
+
+def read_metadata(file):
+    """Read the length-prefixed JSON metadata header"""
+    return read_header(file)[0]
+
+
+def read_file_metadata(path):
+    """Read the metadata header of the .cyberph file at path"""
+    with open(path, 'rb') as file:
+        return read_metadata(file)
+
+
+def format_version(metadata):
+    """Return the major container version recorded in the metadata"""
+    return int(str(metadata.get('version', '1.0')).split('.')[0])
+
+
+class FernetChunkCipher:
+    """Seal v2 chunks as Fernet tokens"""
+
+    def __init__(self, key):
+        self.fernet = Fernet(key)
+
+    def encrypt(self, index, final, chunk):
+        return self.fernet.encrypt(_CHUNK_PREFIX.pack(index, final) + chunk)
+
+    def decrypt(self, index, final, token):
+        plaintext = self.fernet.decrypt(token)
+        chunk_index, chunk_final = _CHUNK_PREFIX.unpack_from(plaintext)
+        if chunk_index != index or chunk_final != final:
+            raise DecryptionError("Encrypted file chunks are out of order")
+        return plaintext[_CHUNK_PREFIX.size:]
+
+    def encrypt_index(self, count, data):
+        return self.encrypt(count, _INDEX_FLAG, data)
+
+    def decrypt_index(self, count, sealed):
+        return self.decrypt(count, _INDEX_FLAG, sealed)
+
+
+class AEADChunkCipher:
+    """Seal v2 chunks as raw AES-GCM or ChaCha20-Poly1305 ciphertext"""
+
+    def __init__(self, cipher, key, nonce_prefix, associated_data, key_salt=None):
+        # Fernet-format keys (password derived or generated) carry 32 bytes of
+        # key material; expand them into a dedicated key for this cipher and,
+        # given its key salt, for this file (format 2.0 files have none)
+        hkdf = HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=key_salt,
+            info=b'cyberph-v2 ' + cipher.encode(),
+        )
+        if cipher not in _AEAD_CLASSES:
+            raise ValueError(f"Unsupported cipher: {cipher}")
+        self.aead = _AEAD_CLASSES[cipher](hkdf.derive(base64.urlsafe_b64decode(key)))
+        self.nonce_prefix = nonce_prefix
+        self.associated_data = associated_data
+
+    def nonce(self, index, final):
+        return self.nonce_prefix + _NONCE_SUFFIX.pack(index, final)
+
+    def encrypt(self, index, final, chunk):
+        return self.aead.encrypt(self.nonce(index, final), chunk, self.associated_data)
+
+    def decrypt(self, index, final, ciphertext):
+        return self.aead.decrypt(self.nonce(index, final), ciphertext, self.associated_data)
+
+    def encrypt_index(self, count, data):
+        return self.encrypt(count, _INDEX_FLAG, data)
+
+    def decrypt_index(self, count, sealed):
+        return self.decrypt(count, _INDEX_FLAG, sealed)
+
+
+def select_cipher(cipher, refresh=False):
+    """Resolve CIPHER_AUTO to the fastest AEAD cipher on this host
+
+    The benchmark runs once per host and is cached (see cyberph.cipherbench);
+    refresh=True measures again. Other cipher names are returned unchanged.
+    """
+    if cipher != CIPHER_AUTO:
+        return cipher
+    return cipherbench.fastest(_AEAD_CLASSES, refresh)
+
+
+def benchmark_ciphers(refresh=False):
+    """Return {cipher: bytes/second} for the AEAD ciphers on this host"""
+    return cipherbench.measure(_AEAD_CLASSES, refresh)
+
+
+def new_cipher_metadata(cipher):
+    """Return the per-file metadata fields needed by the given payload cipher
+
+    CIPHER_AUTO is resolved here, so the header records the cipher actually
+    used and decryption needs no benchmark.
+    """
+    cipher = select_cipher(cipher)
+    if cipher not in CIPHERS:
+        raise ValueError(f"Unsupported cipher: {cipher}")
+    metadata = {'cipher': cipher}
+    if cipher != CIPHER_FERNET:
+        metadata['nonce'] = base64.b64encode(os.urandom(_NONCE_PREFIX_SIZE)).decode()
+        metadata['key_salt'] = base64.b64encode(os.urandom(_KEY_SALT_SIZE)).decode()
+    return metadata
+
+
+def make_chunk_cipher(metadata, metadata_json, key, metrics=None):
+    """Create the chunk cipher described by a v2 metadata header
+
+    With metrics, cipher and compression work is timed per chunk.
+    """
+    cipher = metadata.get('cipher', CIPHER_FERNET)
+    if cipher == CIPHER_FERNET:
+        chunk_cipher = FernetChunkCipher(key)
+    else:
+        nonce_prefix = base64.b64decode(metadata['nonce'])
+        key_salt = metadata.get('key_salt')
+        chunk_cipher = AEADChunkCipher(cipher, key, nonce_prefix, metadata_json,
+                                       key_salt and base64.b64decode(key_salt))
+    if metrics is not None:
+        chunk_cipher = TimedChunkCipher(chunk_cipher, metrics)
+
+    method = metadata.get('compression')
+    if method == compression.COMPRESSION_ZLIB:
+        return compression.ZlibChunkCipher(chunk_cipher, metadata['chunk_size'], metrics=metrics)
+    if method is not None:
+        raise CyberPHError(f"Unsupported compression: {method}")
+    return chunk_cipher
+
+
+def read_full(src, size):
+    """Read size bytes, or fewer only at end of file; pipes may return short reads"""
+    data = src.read(size)
+    if len(data) == size or not data:
+        return data
+    parts = [data]
+    remaining = size - len(data)
+    while remaining:
+        data = src.read(remaining)
+        if not data:
+            break
+        parts.append(data)
+        remaining -= len(data)
+    return b''.join(parts)
+
+
+class _PeekedReader:
+    """File-like reader that replays already-read bytes before the rest of src"""
+
+    def __init__(self, head, src):
+        self.head = head
+        self.src = src
+
+    def read(self, size):
+        if not self.head:
+            return read_full(self.src, size)
+        data, self.head = self.head[:size], self.head[size:]
+        if len(data) < size:
+            data += read_full(self.src, size - len(data))
+        return data
+
+
+def iter_chunks(src, chunk_size, index=0):
+    """Yield (index, final, chunk) for each plaintext chunk of src, numbered from index"""
+    chunk = read_full(src, chunk_size)
+    while True:
+        # Read one chunk ahead so the last frame can be flagged as final
+        next_chunk = read_full(src, chunk_size) if len(chunk) == chunk_size else b''
+        final = not next_chunk
+        yield index, final, chunk
+        if final:
+            return
+        index += 1
+        chunk = next_chunk
+
+
+def encode_frame(final, sealed):
+    """Encode one sealed chunk as a v2 frame"""
+    frame_header = len(sealed) | (_FRAME_FINAL if final else 0)
+    return _FRAME_HEADER.pack(frame_header) + sealed
+
+
+def read_frame(src):
+    """Read one v2 frame, returning (final, sealed)"""
+    frame_header = read_full(src, _FRAME_HEADER.size)
+    if len(frame_header) < _FRAME_HEADER.size:
+        raise CyberPHError("Encrypted file is truncated")
+    frame_header, = _FRAME_HEADER.unpack(frame_header)
+    length = frame_header & ~_FRAME_FINAL
+    sealed = read_full(src, length)
+    if len(sealed) < length:
+        raise CyberPHError("Encrypted file is truncated")
+    return bool(frame_header & _FRAME_FINAL), sealed
+
+
+def skip_frame(src):
+    """Seek past one v2 frame without reading it, returning its final flag"""
+    frame_header = src.read(_FRAME_HEADER.size)
+    if len(frame_header) < _FRAME_HEADER.size:
+        raise CyberPHError("Encrypted file is truncated")
+    frame_header, = _FRAME_HEADER.unpack(frame_header)
+    src.seek(frame_header & ~_FRAME_FINAL, os.SEEK_CUR)
+    return bool(frame_header & _FRAME_FINAL)
+
+
+def _iter_frames(src, trailer=False):
+    """Yield (index, final, sealed) for each v2 frame of src
+
+    Unless the file has a trailer (such as a chunk index), nothing may
+    follow the final frame.
+    """
+    index = 0
+    while True:
+        final, sealed = read_frame(src)
+        yield index, final, sealed
+        if final:
+            break
+        index += 1
+
+    if not trailer and src.read(1):
+        raise CyberPHError("Unexpected data after the final chunk")
+
+
+def _map_ordered(func, items, workers):
+    """Yield (item, func(*item)) in order, running up to `workers` calls at once
+
+    At most two results per worker are held in memory, so streaming stays
+    bounded while the cipher work (which releases the GIL) runs in parallel.
+    """
+    if workers <= 1:
+        for item in items:
+            yield item, func(*item)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append((item, executor.submit(func, *item)))
+            if len(pending) >= workers * 2:
+                item, future = pending.popleft()
+                yield item, future.result()
+        while pending:
+            item, future = pending.popleft()
+            yield item, future.result()
+
+
+def with_total(progress, total):
+    """Adapt a progress(done, total) callback to the per-chunk progress(done) form"""
+    if progress is None:
+        return None
+    return lambda done: progress(done, total)
+
+
+def _check_cancelled(cancel):
+    if cancel is not None and cancel.is_set():
+        raise OperationCancelled("Operation cancelled")
+
+
+def encrypt_chunks(cipher, src, dst, chunk_size=CHUNK_SIZE, workers=1,
+                   progress=None, cancel=None, chunk_index=False, offsets=None, total=0,
+                   position=0, on_frame=None):
+    """Encrypt src into dst as a stream of v2 frames, returning the bytes read
+
+    progress(bytes_done) is called after every chunk; cancel is an optional
+    threading.Event checked between chunks. With chunk_index, a sealed index
+    of frame offsets is appended so ranges can be decrypted without reading
+    the whole file.
+
+    To continue an interrupted payload, pass the offsets of the frames
+    already in dst, the plaintext bytes they hold (total) and the payload
+    bytes they take up (position), with src positioned just past that
+    plaintext. on_frame(index, final, total, position) is called after each
+    frame is written.
+    """
+    offsets = [] if offsets is None else offsets
+    chunks = iter_chunks(src, chunk_size, len(offsets))
+    for (index, final, chunk), sealed in _map_ordered(cipher.encrypt, chunks, workers):
+        _check_cancelled(cancel)
+        frame = encode_frame(final, sealed)
+        dst.write(frame)
+        offsets.append(position)
+        position += len(frame)
+        total += len(chunk)
+        if progress is not None:
+            progress(total)
+        if on_frame is not None:
+            on_frame(index, final, total, position)
+
+    if chunk_index:
+        write_chunk_index(cipher, dst, total, offsets)
+    return total
+
+
+def write_sealed_trailer(cipher, dst, data, count):
+    """Append data sealed as a trailer, followed by a footer that locates it
+
+    count is the number of chunks before the trailer; it fixes the trailer's
+    nonce so it can never collide with a chunk's.
+    """
+    sealed = cipher.encrypt_index(count, data)
+    dst.write(sealed)
+    dst.write(_INDEX_FOOTER.pack(len(sealed), count))
+
+
+def read_sealed_trailer(cipher, src):
+    """Read and authenticate a trailer from the end of src, returning (data, count)"""
+    end = src.seek(0, os.SEEK_END)
+    if end < _INDEX_FOOTER.size:
+        raise CyberPHError("File is truncated: no trailer footer")
+    src.seek(end - _INDEX_FOOTER.size)
+    length, count = _INDEX_FOOTER.unpack(src.read(_INDEX_FOOTER.size))
+    if length > end - _INDEX_FOOTER.size:
+        raise CyberPHError("File is truncated or its trailer footer is corrupted")
+    src.seek(end - _INDEX_FOOTER.size - length)
+    return cipher.decrypt_index(count, src.read(length)), count
+
+
+def write_chunk_index(cipher, dst, total, offsets):
+    """Append the sealed chunk index trailer"""
+    data = _INDEX_TOTAL.pack(total) + b''.join(_INDEX_OFFSET.pack(offset) for offset in offsets)
+    write_sealed_trailer(cipher, dst, data, len(offsets))
+
+
+def read_chunk_index(cipher, src):
+    """Read and authenticate the chunk index trailer, returning (total, offsets)
+
+    Offsets are relative to the start of the payload, just after the header.
+    """
+    data, count = read_sealed_trailer(cipher, src)
+    total, = _INDEX_TOTAL.unpack_from(data)
+    offsets = [offset for offset, in _INDEX_OFFSET.iter_unpack(data[_INDEX_TOTAL.size:])]
+    if len(offsets) != count:
+        raise CyberPHError("Chunk index is corrupted")
+    return total, offsets
+
+
+def decrypt_chunks(cipher, src, dst, workers=1, progress=None, cancel=None, trailer=False):
+    """Decrypt a stream of v2 frames from src into dst, returning the bytes written"""
+    total = 0
+    for _, chunk in _map_ordered(cipher.decrypt, _iter_frames(src, trailer), workers):
+        _check_cancelled(cancel)
+        dst.write(chunk)
+        total += len(chunk)
+        if progress is not None:
+            progress(total)
+    return total
+
+
+def fsync_directory(path):
+    """Flush a directory entry (such as a rename) to disk, where the OS allows it"""
+    try:
+        fd = os.open(path or '.', os.O_RDONLY)
+    except OSError:
+        # Windows cannot open directories; NTFS journals the rename itself
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class AtomicOutput:
+    """Write to a temporary .part file that replaces path only on success
+
+    With fsync, the data and the rename are flushed to disk before the
+    with block returns, so the output survives a power loss.
+    """
+
+    def __init__(self, path, fsync=False):
+        self.path = path
+        self.part_path = path + '.part'
+        self.fsync = fsync
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.part_path, 'wb')
+        return self.file
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None and self.fsync:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        self.file.close()
+        if exc_type is None:
+            os.replace(self.part_path, self.path)
+            if self.fsync:
+                fsync_directory(os.path.dirname(self.path))
+        else:
+            os.remove(self.part_path)
+        return False
+
+
+def resolve_key(metadata, password=None, key=None, keyring=None, key_cache=None):
+    """Return the key for a file's metadata from a password, key or keyring
+
+    With a KeyCache, a key already derived for the file's salt and KDF is
+    reused without the password, and newly derived keys are added to it.
+    The key is checked against the header before it is returned. Only keys
+    confirmed by a key check value are cached: for older files without one,
+    a mistyped password would otherwise stay cached until it expired.
+    """
+    encryption_method = metadata.get('encryption_method', 'password')
+    if encryption_method == "password" and key is None and key_cache is not None:
+        key = key_cache.key_for(metadata)
+    if encryption_method == "password" and key is None and password is not None:
+        salt = base64.b64decode(metadata['salt'])
+        key, _ = derive_key(password, salt, metadata.get('kdf'))
+        check_key(metadata, key)
+        if key_cache is not None and 'key_check' in metadata:
+            key_cache.add_for(metadata, key)
+        return key
+    elif encryption_method == "key" and keyring is not None and key is None:
+        key = keyring.key_for(metadata)
+    elif key is None:
+        raise ValueError("A password or encryption key is required to decrypt this file")
+    check_key(metadata, key)
+    return key
+
+
+@contextmanager
+def _forget_key_on_failure(key_cache, metadata):
+    """Drop the cached key for metadata if the payload fails to authenticate"""
+    try:
+        yield
+    except DecryptionError:
+        if key_cache is not None:
+            key_cache.discard_for(metadata)
+        raise
+
+
+class NullOutput:
+    """Writable sink that discards everything, for verifying without output"""
+
+    def write(self, data):
+        return len(data)
+
+
+def encrypted_path(path):
+    """Default output path for encrypting path"""
+    return path + ENCRYPTED_EXTENSION
+
+
+def decrypted_path(path, metadata):
+    """Default output path for decrypting path, next to the encrypted file"""
+    return os.path.join(os.path.dirname(path), f"decrypted_{metadata['original_filename']}")
+
+
+def new_metadata(original_filename, file_size, key, salt=None, cipher=DEFAULT_CIPHER,
+                 compress=None, chunk_size=CHUNK_SIZE, kdf=None):
+    """Build the metadata header for a new v2 file
+
+    file_size may be None when the input length is not known up front, as
+    when encrypting from a pipe. compress must already be resolved to
+    'zlib' or None. kdf is the spec the key was derived with, for
+    password-encrypted files.
+    """
+    metadata = {
+        'original_filename': original_filename,
+        'file_size': file_size,
+        'encryption_timestamp': datetime.now().isoformat(timespec='seconds'),
+        'encryption_method': "key" if salt is None else "password",
+        'version': FORMAT_VERSION,
+        'chunk_size': chunk_size,
+        'chunk_index': True
+    }
+    metadata.update(new_cipher_metadata(cipher))
+    metadata['key_check'] = key_check_value(key)
+
+    if compress is not None:
+        metadata['compression'] = compress
+
+    if salt is not None:
+        metadata['salt'] = base64.b64encode(salt).decode()
+        metadata['kdf'] = normalize_kdf(kdf)
+    else:
+        metadata['key_fingerprint'] = key_fingerprint(key)
+    return metadata
+
+
+def encrypt_stream(src, dst, password=None, key=None, salt=None, cipher=DEFAULT_CIPHER,
+                   compress=compression.COMPRESSION_AUTO, chunk_size=CHUNK_SIZE,
+                   workers=DEFAULT_WORKERS, original_filename='stdin', file_size=None,
+                   sample=None, progress=None, cancel=None, kdf=None, metrics=None):
+    """Encrypt everything readable from src into a .cyberph stream on dst
+
+    Works on pipes: memory is bounded by a few chunks per worker and the
+    input size does not need to be known. With compress='auto' and no
+    sample, the first chunk of src is used to decide. A cyberph.metrics
+    Metrics object collects per-stage timings. Returns the metadata.
+    """
+    if (password is None) == (key is None):
+        raise ValueError("Exactly one of password or key is required")
+    start = time.perf_counter()
+    if metrics is not None:
+        src, dst = TimedReader(src, metrics), TimedWriter(dst, metrics)
+    if password is not None:
+        with timed(metrics, STAGE_KDF):
+            key, salt = derive_key(password, kdf=kdf)
+
+    if compress == compression.COMPRESSION_AUTO and sample is None:
+        sample = read_full(src, chunk_size)
+        src = _PeekedReader(sample, src)
+    compress = compression.choose_compression(compress, sample or b'')
+
+    metadata = new_metadata(original_filename, file_size, key, salt, cipher, compress, chunk_size,
+                            kdf)
+    metadata_json = write_metadata(dst, metadata)
+    chunk_cipher = make_chunk_cipher(metadata, metadata_json, key, metrics)
+    total = encrypt_chunks(chunk_cipher, src, dst, chunk_size, workers,
+                           with_total(progress, file_size), cancel, chunk_index=True)
+    if metrics is not None:
+        metrics.add(STAGE_TOTAL, time.perf_counter() - start, total)
+    return metadata
+
+
+def encrypt_file(input_path, output_path=None, password=None, key=None, salt=None,
+                 cipher=DEFAULT_CIPHER, compress=compression.COMPRESSION_AUTO,
+                 chunk_size=CHUNK_SIZE, workers=DEFAULT_WORKERS, progress=None, cancel=None,
+                 kdf=None, metrics=None, fsync=False):
+    """Encrypt input_path with a password or key, returning (output_path, metadata)
+
+    A key previously derived with derive_key() can be passed together with its
+    salt and KDF spec, so that a batch of files shares a single key derivation.
+    kdf picks the password KDF (see cyberph.kdf); its spec goes into the header.
+    compress is 'auto' (zlib unless a sample of the input looks high-entropy),
+    'zlib' or None.
+    progress(bytes_done, total_bytes) reports plaintext bytes processed, and
+    setting the cancel event stops the operation with OperationCancelled.
+    metrics, a cyberph.metrics.Metrics, collects per-stage timings.
+    The output only appears once it is complete; with fsync it is also on
+    disk when this returns, e.g. before the plaintext is deleted.
+    """
+    if output_path is None:
+        output_path = encrypted_path(input_path)
+    sample = compression.sample_file(input_path) if compress == compression.COMPRESSION_AUTO else b''
+
+    with open(input_path, 'rb') as src, AtomicOutput(output_path, fsync) as dst:
+        metadata = encrypt_stream(
+            src, dst, password, key, salt, cipher, compress, chunk_size, workers,
+            original_filename=os.path.basename(input_path),
+            file_size=os.fstat(src.fileno()).st_size,
+            sample=sample, progress=progress, cancel=cancel, kdf=kdf, metrics=metrics)
+
+    return output_path, metadata
+
+
+def _decrypt_payload(src, dst, metadata, metadata_json, key, workers, progress, cancel,
+                     metrics=None):
+    """Decrypt the payload following an already-read header, returning the bytes written"""
+    if metadata.get('bundle'):
+        raise CyberPHError("This file is a bundle; extract its members with cyberph.bundle")
+    if metrics is not None:
+        src = TimedReader(src, metrics)
+        if not isinstance(dst, NullOutput):
+            dst = TimedWriter(dst, metrics)
+    file_size = metadata.get('file_size')
+    try:
+        if format_version(metadata) < 2:
+            # v1 files hold a single Fernet token for the whole file
+            token = src.read()
+            with timed(metrics, STAGE_CIPHER, len(token)):
+                data = Fernet(key).decrypt(token)
+            dst.write(data)
+            total = len(data)
+            if progress is not None:
+                progress(total, total)
+        else:
+            chunk_cipher = make_chunk_cipher(metadata, metadata_json, key, metrics)
+            total = decrypt_chunks(chunk_cipher, src, dst, workers,
+                                   with_total(progress, file_size), cancel,
+                                   trailer=metadata.get('chunk_index', False))
+    except (InvalidToken, InvalidTag):
+        raise DecryptionError("Wrong password or key, or the file is corrupted")
+
+    if file_size is not None and total != file_size:
+        raise CyberPHError(f"Decrypted {total} bytes but the header records {file_size}")
+    return total
+
+
+def decrypt_stream(src, dst, password=None, key=None, keyring=None,
+                   workers=DEFAULT_WORKERS, progress=None, cancel=None, key_cache=None,
+                   metrics=None):
+    """Decrypt a .cyberph stream from src (file or pipe) into dst, returning the metadata"""
+    start = time.perf_counter()
+    metadata, metadata_json = read_header(src)
+    with timed(metrics, STAGE_KDF):
+        key = resolve_key(metadata, password, key, keyring, key_cache)
+    with _forget_key_on_failure(key_cache, metadata):
+        total = _decrypt_payload(src, dst, metadata, metadata_json, key, workers, progress,
+                                 cancel, metrics)
+    if metrics is not None:
+        metrics.add(STAGE_TOTAL, time.perf_counter() - start, total)
+    return metadata
+
+
+def decrypt_file(input_path, output_path=None, password=None, key=None, keyring=None,
+                 workers=DEFAULT_WORKERS, progress=None, cancel=None, key_cache=None,
+                 metrics=None):
+    """Decrypt input_path with a password or key, returning (output_path, metadata)
+
+    For password-encrypted files, key may instead be a key already derived
+    from the password and the salt in the file's metadata, and a KeyCache
+    can supply or remember it. For key-encrypted files, a KeyRing can
+    supply the key matching the file's fingerprint. metrics, a
+    cyberph.metrics.Metrics, collects per-stage timings.
+    """
+    start = time.perf_counter()
+    with open(input_path, 'rb') as src:
+        metadata, metadata_json = read_header(src)
+        with timed(metrics, STAGE_KDF):
+            key = resolve_key(metadata, password, key, keyring, key_cache)
+
+        if output_path is None:
+            output_path = decrypted_path(input_path, metadata)
+
+        with _forget_key_on_failure(key_cache, metadata), AtomicOutput(output_path) as dst:
+            total = _decrypt_payload(src, dst, metadata, metadata_json, key, workers, progress,
+                                     cancel, metrics)
+    if metrics is not None:
+        metrics.add(STAGE_TOTAL, time.perf_counter() - start, total)
+
+    return output_path, metadata
+
+
+def verify_file(input_path, password=None, key=None, keyring=None, key_cache=None,
+                workers=DEFAULT_WORKERS, progress=None, cancel=None, metrics=None):
+    """Authenticate every chunk of input_path without writing any plaintext
+
+    The header, every chunk (or the v1 token) and the chunk index trailer
+    are checked; the plaintext is discarded as it is produced. Raises
+    DecryptionError or CyberPHError on the first problem and returns the
+    metadata if the file is intact.
+    """
+    start = time.perf_counter()
+    with open(input_path, 'rb') as src:
+        metadata, metadata_json = read_header(src)
+        with timed(metrics, STAGE_KDF):
+            key = resolve_key(metadata, password, key, keyring, key_cache)
+        with _forget_key_on_failure(key_cache, metadata):
+            total = _decrypt_payload(src, NullOutput(), metadata, metadata_json, key, workers,
+                                     progress, cancel, metrics)
+        if metadata.get('chunk_index'):
+            cipher = make_chunk_cipher(metadata, metadata_json, key)
+            try:
+                index_total, _ = read_chunk_index(cipher, src)
+            except (InvalidToken, InvalidTag):
+                raise DecryptionError("Chunk index failed authentication")
+            if index_total != total:
+                raise CyberPHError(f"Chunk index records {index_total} bytes, payload has {total}")
+    if metrics is not None:
+        metrics.add(STAGE_TOTAL, time.perf_counter() - start, total)
+    return metadata
@@ -0,0 +1,502 @@
+"""
+CyberPH Encryptor/Decryptor GUI
+Tkinter front end for the encryption engine.
+"""
+
+import os
+import queue
+import threading
+import tkinter as tk
+from tkinter import ttk, filedialog, messagebox, simpledialog
+
+from . import engine
+from .keycache import KeyCache
+from .keyring import KeyRing
+from .metrics import Metrics
+from .engine import CIPHER_CHOICES, DEFAULT_CIPHER, DEFAULT_WORKERS
+
+class CyberPHEncryptor:
+    def __init__(self):
+        self.root = tk.Tk()
+        self.root.title("CyberPH Encryptor/Decryptor v1.0")
+        self.root.geometry("800x600")
+        self.root.configure(bg='#2c3e50')
+        
+        # Set application icon and styling
+        self.setup_styles()
+        self.create_gui()
+        
+    def setup_styles(self):
+        """Setup custom styles for the application"""
+        style = ttk.Style()
+        style.theme_use('clam')
+        
+        # Configure custom styles
+        style.configure('Title.TLabel', 
+                       background='#2c3e50', 
+                       foreground='#ecf0f1', 
+                       font=('Arial', 16, 'bold'))
+        
+        style.configure('Heading.TLabel', 
+                       background='#2c3e50', 
+                       foreground='#ecf0f1', 
+                       font=('Arial', 12, 'bold'))
+        
+        style.configure('Custom.TButton',
+                       background='#3498db',
+                       foreground='white',
+                       font=('Arial', 10, 'bold'),
+                       padding=10)
+        
+        style.map('Custom.TButton',
+                 background=[('active', '#2980b9')])
+        
+    def create_gui(self):
+        """Create the main GUI interface"""
+        # Main frame
+        main_frame = tk.Frame(self.root, bg='#2c3e50', padx=20, pady=20)
+        main_frame.pack(fill='both', expand=True)
+        
+        # Title
+        title_label = ttk.Label(main_frame, text="CyberPH Encryptor/Decryptor", style='Title.TLabel')
+        title_label.pack(pady=(0, 20))
+        
+        # Subtitle
+        subtitle_label = ttk.Label(main_frame, text="Secure Document Encryption & Decryption", style='Heading.TLabel')
+        subtitle_label.pack(pady=(0, 30))
+        
+        # File selection frame
+        file_frame = tk.Frame(main_frame, bg='#2c3e50')
+        file_frame.pack(fill='x', pady=(0, 20))
+        
+        self.file_label = ttk.Label(file_frame, text="No file selected", background='#34495e', foreground='#ecf0f1', padding=10)
+        self.file_label.pack(side='left', fill='x', expand=True, padx=(0, 10))
+        
+        select_btn = ttk.Button(file_frame, text="Select File", command=self.select_file, style='Custom.TButton')
+        select_btn.pack(side='right')
+        
+        # Encryption method selection
+        method_frame = tk.Frame(main_frame, bg='#2c3e50')
+        method_frame.pack(fill='x', pady=10)
+        
+        method_label = ttk.Label(method_frame, text="Encryption Method:", style='Heading.TLabel')
+        method_label.pack(side='left')
+        
+        self.encryption_method = tk.StringVar(value="password")
+        password_rb = tk.Radiobutton(method_frame, text="Password", variable=self.encryption_method, 
+                                   value="password", bg='#2c3e50', fg='#ecf0f1', 
+                                   selectcolor='#34495e', activebackground='#34495e')
+        password_rb.pack(side='left', padx=(20, 10))
+        
+        key_rb = tk.Radiobutton(method_frame, text="Encryption Key", variable=self.encryption_method, 
+                              value="key", bg='#2c3e50', fg='#ecf0f1', 
+                              selectcolor='#34495e', activebackground='#34495e')
+        key_rb.pack(side='left', padx=(10, 20))
+        
+        # Key management frame
+        key_frame = tk.Frame(main_frame, bg='#2c3e50')
+        key_frame.pack(fill='x', pady=10)
+        
+        generate_key_btn = ttk.Button(key_frame, text="Generate Key", 
+                                    command=self.generate_key, style='Custom.TButton')
+        generate_key_btn.pack(side='left', padx=(0, 5))
+        
+        import_key_btn = ttk.Button(key_frame, text="Import Key", 
+                                  command=self.import_key, style='Custom.TButton')
+        import_key_btn.pack(side='left', padx=(5, 5))
+        
+        export_key_btn = ttk.Button(key_frame, text="Export Key", 
+                                  command=self.export_key, style='Custom.TButton')
+        export_key_btn.pack(side='left', padx=(5, 0))
+        
+        # Current key display
+        self.key_display = ttk.Label(key_frame, text="No key loaded", 
+                                   background='#34495e', foreground='#ecf0f1', 
+                                   font=('Consolas', 8), padding=5)
+        self.key_display.pack(side='right', fill='x', expand=True, padx=(20, 0))
+        
+        # Payload cipher selection
+        cipher_frame = tk.Frame(main_frame, bg='#2c3e50')
+        cipher_frame.pack(fill='x', pady=10)
+        
+        cipher_label = ttk.Label(cipher_frame, text="Cipher:", style='Heading.TLabel')
+        cipher_label.pack(side='left')
+        
+        self.cipher = tk.StringVar(value=DEFAULT_CIPHER)
+        cipher_box = ttk.Combobox(cipher_frame, textvariable=self.cipher, values=CIPHER_CHOICES,
+                                  state='readonly', width=20)
+        cipher_box.pack(side='left', padx=(20, 0))
+        
+        workers_label = ttk.Label(cipher_frame, text="Workers:", style='Heading.TLabel')
+        workers_label.pack(side='left', padx=(30, 0))
+        
+        self.workers = tk.IntVar(value=DEFAULT_WORKERS)
+        workers_box = ttk.Spinbox(cipher_frame, from_=1, to=64, textvariable=self.workers, width=5)
+        workers_box.pack(side='left', padx=(20, 0))
+        
+        # Operation buttons frame
+        operation_frame = tk.Frame(main_frame, bg='#2c3e50')
+        operation_frame.pack(fill='x', pady=20)
+    
+        self.encrypt_btn = ttk.Button(operation_frame, text="Encrypt File", 
+                               command=self.encrypt_file, style='Custom.TButton')
+        self.encrypt_btn.pack(side='left', padx=(0, 10), fill='x', expand=True)
+        
+        self.decrypt_btn = ttk.Button(operation_frame, text="Decrypt File", 
+                               command=self.decrypt_file, style='Custom.TButton')
+        self.decrypt_btn.pack(side='right', padx=(10, 0), fill='x', expand=True)
+        
+        # Progress bar, driven by bytes processed, and cancel button
+        progress_frame = tk.Frame(main_frame, bg='#2c3e50')
+        progress_frame.pack(fill='x', pady=20)
+        
+        self.progress = ttk.Progressbar(progress_frame, mode='determinate', maximum=100)
+        self.progress.pack(side='left', fill='x', expand=True)
+        
+        self.cancel_btn = ttk.Button(progress_frame, text="Cancel", command=self.cancel_operation,
+                                     style='Custom.TButton', state='disabled')
+        self.cancel_btn.pack(side='right', padx=(10, 0))
+        
+        # Status text area
+        status_frame = tk.Frame(main_frame, bg='#2c3e50')
+        status_frame.pack(fill='both', expand=True, pady=(20, 0))
+        
+        status_label = ttk.Label(status_frame, text="Status Log:", style='Heading.TLabel')
+        status_label.pack(anchor='w')
+        
+        self.status_text = tk.Text(status_frame, bg='#34495e', fg='#ecf0f1', 
+                                  font=('Consolas', 10), height=15, wrap='word')
+        self.status_text.pack(fill='both', expand=True, pady=(5, 0))
+        
+        # Scrollbar for status text
+        scrollbar = tk.Scrollbar(self.status_text)
+        scrollbar.pack(side='right', fill='y')
+        self.status_text.config(yscrollcommand=scrollbar.set)
+        scrollbar.config(command=self.status_text.yview)
+        
+        # Footer
+        footer_label = ttk.Label(main_frame, text="© 2024 CyberPH - Secure Document Protection", 
+                               background='#2c3e50', foreground='#95a5a6', font=('Arial', 8))
+        footer_label.pack(pady=(20, 0))
+        
+        self.selected_file = None
+        self.current_key = None
+        self.keyring = KeyRing()
+        # Keys derived from passwords this session, so reopening files made
+        # with the same password does not prompt or rerun the KDF
+        self.key_cache = KeyCache()
+        self.operation = None
+        self.log_message("CyberPH Encryptor/Decryptor initialized successfully.")
+        self.log_message("Supported formats: TXT, DOC, DOCX, PDF, and more...")
+        self.log_message("Choose between Password or Encryption Key methods.")
+        
+    def log_message(self, message):
+        """Add a message to the status log"""
+        self.status_text.insert(tk.END, f"[{self.get_timestamp()}] {message}\n")
+        self.status_text.see(tk.END)
+        self.root.update_idletasks()
+        
+    def get_timestamp(self):
+        """Get current timestamp"""
+        from datetime import datetime
+        return datetime.now().strftime("%H:%M:%S.%f")[:-3]
+        
+    def select_file(self):
+        """Open file dialog to select a file"""
+        file_types = [
+            ("All Supported", "*.txt;*.doc;*.docx;*.pdf;*.xlsx;*.pptx;*.jpg;*.png;*.zip"),
+            ("Text files", "*.txt"),
+            ("Word documents", "*.doc;*.docx"),
+            ("PDF files", "*.pdf"),
+            ("Excel files", "*.xlsx"),
+            ("PowerPoint files", "*.pptx"),
+            ("Images", "*.jpg;*.jpeg;*.png;*.bmp;*.gif"),
+            ("Archives", "*.zip;*.rar;*.7z"),
+            ("All files", "*.*")
+        ]
+        
+        filename = filedialog.askopenfilename(
+            title="Select file to encrypt/decrypt",
+            filetypes=file_types
+        )
+        
+        if filename:
+            self.selected_file = filename
+            self.file_label.config(text=f"Selected: {os.path.basename(filename)}")
+            self.log_message(f"File selected: {filename}")
+            
+    def generate_key(self):
+        """Generate a new random encryption key"""
+        try:
+            # Generate a new Fernet key
+            new_key = engine.generate_key()
+            self.current_key = new_key
+            self.keyring.add(new_key)
+            
+            # Display key preview (first 16 chars + ...)
+            key_preview = new_key.decode()[:16] + "..."
+            self.key_display.config(text=f"Key: {key_preview}")
+            
+            self.log_message("New encryption key generated successfully!")
+            self.log_message("Remember to export and save your key securely.")
+            
+            # Ask if user wants to save the key
+            if messagebox.askyesno("Save Key", "Would you like to save this key to a file?"):
+                self.export_key()
+                
+        except Exception as e:
+            self.log_message(f"Key generation failed: {str(e)}")
+            messagebox.showerror("Error", f"Key generation failed: {str(e)}")
+            
+    def import_key(self):
+        """Import an encryption key from file"""
+        try:
+            file_paths = filedialog.askopenfilenames(
+                title="Import Encryption Keys",
+                filetypes=[("Key files", "*.key"), ("Text files", "*.txt"), ("All files", "*.*")]
+            )
+            
+            if not file_paths:
+                return
+                
+            # Every imported key goes into the keyring; the last one becomes
+            # the key used for encryption
+            for file_path in file_paths:
+                key_data = engine.load_key(file_path)
+                fingerprint = self.keyring.add(key_data)
+                self.current_key = key_data
+                self.log_message(f"Encryption key {fingerprint[:16]} imported from: {os.path.basename(file_path)}")
+            
+            # Display key preview
+            key_preview = self.current_key.decode()[:16] + "..."
+            self.key_display.config(text=f"Key: {key_preview} ({len(self.keyring)} in keyring)")
+                
+        except Exception as e:
+            self.log_message(f"Key import failed: {str(e)}")
+            messagebox.showerror("Error", f"Key import failed: {str(e)}")
+            
+    def export_key(self):
+        """Export the current encryption key to file"""
+        if not self.current_key:
+            messagebox.showerror("Error", "No key to export! Generate a key first.")
+            return
+            
+        try:
+            # Get save location
+            file_path = filedialog.asksaveasfilename(
+                title="Export Encryption Key",
+                defaultextension=".key",
+                filetypes=[("Key files", "*.key"), ("Text files", "*.txt"), ("All files", "*.*")]
+            )
+            
+            if not file_path:
+                return
+                
+            # Save key with metadata, plus just the raw key
+            raw_key_path = engine.export_key(self.current_key, file_path)
+                
+            self.log_message(f"Key exported to: {os.path.basename(file_path)}")
+            self.log_message(f"Raw key saved to: {os.path.basename(raw_key_path)}")
+            messagebox.showinfo("Success", f"Key exported successfully!\n\nKey file: {os.path.basename(file_path)}\nRaw key: {os.path.basename(raw_key_path)}")
+            
+        except Exception as e:
+            self.log_message(f"Key export failed: {str(e)}")
+            messagebox.showerror("Error", f"Key export failed: {str(e)}")
+        
+    def encrypt_file(self):
+        """Encrypt the selected file"""
+        if not self.selected_file:
+            messagebox.showerror("Error", "Please select a file first!")
+            return
+            
+        if not os.path.exists(self.selected_file):
+            messagebox.showerror("Error", "Selected file does not exist!")
+            return
+            
+        # Determine encryption method
+        method = self.encryption_method.get()
+        
+        if method == "password":
+            # Get password from user
+            password = simpledialog.askstring("Password", "Enter encryption password:", show='*')
+            if not password:
+                return
+                
+            # Confirm password
+            confirm_password = simpledialog.askstring("Confirm Password", "Confirm encryption password:", show='*')
+            if password != confirm_password:
+                messagebox.showerror("Error", "Passwords do not match!")
+                return
+        else:
+            # Use encryption key
+            if not self.current_key:
+                messagebox.showerror("Error", "No encryption key available! Generate or import a key first.")
+                return
+            password = None
+            
+        self.log_message("Starting encryption process...")
+        
+        # Stream the file through the cipher chunk by chunk on a worker thread
+        cipher = self.cipher.get()
+        self.log_message(f"Encrypting file data with {cipher}...")
+        key = self.current_key if method == "key" else None
+        self.start_operation("Encryption", self.encryption_finished, engine.encrypt_file,
+                             self.selected_file, password=password, key=key,
+                             cipher=cipher, workers=self.workers.get())
+        
+    def encryption_finished(self, result):
+        """Report a completed encryption"""
+        output_file, _ = result
+        self.log_message(f"Encrypted file saved as: {output_file}")
+        self.log_message("File encrypted successfully!")
+        messagebox.showinfo("Success", f"File encrypted successfully!\nSaved as: {os.path.basename(output_file)}")
+            
+    def decrypt_file(self):
+        """Decrypt the selected file"""
+        if not self.selected_file:
+            messagebox.showerror("Error", "Please select a file first!")
+            return
+            
+        if not os.path.exists(self.selected_file):
+            messagebox.showerror("Error", "Selected file does not exist!")
+            return
+            
+        if not self.selected_file.endswith('.cyberph'):
+            messagebox.showerror("Error", "Please select a .cyberph encrypted file!")
+            return
+            
+        self.log_message("Starting decryption process...")
+        
+        try:
+            # Read metadata
+            self.log_message("Reading encrypted file...")
+            metadata = engine.read_file_metadata(self.selected_file)
+        except Exception as e:
+            self.log_message(f"Decryption failed: {str(e)}")
+            messagebox.showerror("Error", f"Decryption failed: {str(e)}")
+            return
+            
+        # Determine decryption method and get key
+        encryption_method = metadata.get('encryption_method', 'password')
+        
+        if encryption_method == "password":
+            password = None
+            key = self.key_cache.key_for(metadata)
+            if key is not None:
+                self.log_message("Using the cached key for this password.")
+            else:
+                # Get password from user
+                password = simpledialog.askstring("Password", "Enter decryption password:", show='*')
+                if not password:
+                    return
+        else:
+            # Pick the key by fingerprint from the keyring, falling back to the
+            # current key for files written before fingerprints were recorded
+            fingerprint = metadata.get('key_fingerprint')
+            if fingerprint is not None:
+                key = self.keyring.get(fingerprint)
+                if key is None:
+                    messagebox.showerror("Error", f"No imported key matches this file (fingerprint {fingerprint[:16]}). Import the correct key first.")
+                    return
+            elif self.current_key:
+                key = self.current_key
+            else:
+                messagebox.showerror("Error", "No encryption key available! Import the correct key first.")
+                return
+            password = None
+        
+        # Decrypt the data on a worker thread
+        self.log_message("Decrypting file data...")
+        self.start_operation("Decryption", self.decryption_finished, engine.decrypt_file,
+                             self.selected_file, password=password, key=key,
+                             workers=self.workers.get(), key_cache=self.key_cache)
+        
+    def decryption_finished(self, result):
+        """Report a completed decryption"""
+        output_file, metadata = result
+        self.log_message(f"Decrypted file saved as: {output_file}")
+        self.log_message("File decrypted successfully!")
+        self.log_message(f"Original filename: {metadata['original_filename']}")
+        if metadata.get('file_size') is not None:
+            self.log_message(f"Original size: {metadata['file_size']} bytes")
+        messagebox.showinfo("Success", f"File decrypted successfully!\nSaved as: {os.path.basename(output_file)}")
+        
+    def start_operation(self, name, on_success, func, *args, **kwargs):
+        """Run an engine call on a worker thread, reporting back through a queue
+        
+        Tk widgets may only be touched from the main thread, so the worker
+        posts progress and its result to a queue that poll_operation drains
+        with root.after.
+        """
+        events = queue.Queue()
+        cancel = threading.Event()
+        metrics = Metrics(name.lower())
+        
+        def report_progress(done, total):
+            events.put(('progress', done, total))
+        
+        def worker():
+            try:
+                result = func(*args, progress=report_progress, cancel=cancel, metrics=metrics,
+                              **kwargs)
+                events.put(('done', result))
+            except engine.OperationCancelled:
+                events.put(('cancelled', None))
+            except Exception as e:
+                events.put(('error', e))
+        
+        self.operation = (name, on_success, events, cancel, metrics)
+        self.progress['value'] = 0
+        self.encrypt_btn.config(state='disabled')
+        self.decrypt_btn.config(state='disabled')
+        self.cancel_btn.config(state='normal')
+        threading.Thread(target=worker, daemon=True).start()
+        self.root.after(100, self.poll_operation)
+        
+    def poll_operation(self):
+        """Apply queued progress updates and handle the worker's result"""
+        name, on_success, events, _, metrics = self.operation
+        while True:
+            try:
+                event = events.get_nowait()
+            except queue.Empty:
+                self.root.after(100, self.poll_operation)
+                return
+                
+            if event[0] == 'progress':
+                _, done, total = event
+                self.progress['value'] = 100 * done / total if total else 100
+                continue
+                
+            self.operation = None
+            self.encrypt_btn.config(state='normal')
+            self.decrypt_btn.config(state='normal')
+            self.cancel_btn.config(state='disabled')
+            
+            kind, payload = event
+            if kind == 'done':
+                self.progress['value'] = 100
+                self.log_message(f"{name} timings: {metrics}")
+                on_success(payload)
+            elif kind == 'cancelled':
+                self.progress['value'] = 0
+                self.log_message(f"{name} cancelled. No output was written.")
+            else:
+                self.progress['value'] = 0
+                self.log_message(f"{name} failed: {str(payload)}")
+                messagebox.showerror("Error", f"{name} failed: {str(payload)}")
+            return
+            
+    def cancel_operation(self):
+        """Ask the running operation to stop"""
+        if self.operation:
+            self.operation[3].set()
+            self.cancel_btn.config(state='disabled')
+            self.log_message("Cancelling...")
+            
+    def run(self):
+        """Start the application"""
+        try:
+            self.root.mainloop()
+        finally:
+            self.key_cache.clear()
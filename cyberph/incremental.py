@@ -0,0 +1,205 @@
+"""
+CyberPH incremental encryption
+Mirror a source tree into an encrypted output tree, re-encrypting only files
+that were added or changed since the last run and removing outputs whose
+source is gone. A manifest next to the outputs records what was encrypted.
+"""
+
+import os
+import json
+import hmac
+import base64
+import hashlib
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from . import batch, compression, engine
+from .kdf import DEFAULT_KDF, LEGACY_KDF, calibrate, normalize as normalize_kdf
+
+MANIFEST_NAME = '.cyberph-manifest.json'
+MANIFEST_VERSION = 1
+
+
+class SyncSummary(batch.BatchSummary):
+    """Batch totals plus the files left alone and the outputs removed"""
+
+    def __init__(self, operation='sync'):
+        super().__init__(operation)
+        self.unchanged = 0
+        self.removed = 0
+
+    def as_dict(self):
+        summary = super().as_dict()
+        summary['unchanged'] = self.unchanged
+        summary['removed'] = self.removed
+        return summary
+
+    def __str__(self):
+        return f"{super().__str__()}, {self.unchanged} unchanged, {self.removed} removed"
+
+
+def manifest_hash_key(key):
+    """Key for the manifest's content hashes
+
+    Hashes are keyed so the manifest cannot be used to confirm guesses about
+    the plaintext.
+    """
+    hkdf = HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=b'cyberph-v2 manifest',
+    )
+    return hkdf.derive(base64.urlsafe_b64decode(key))
+
+
+def content_hash(path, hash_key, block_size=engine.CHUNK_SIZE):
+    """Keyed SHA-256 of a file's contents, as hex"""
+    digest = hmac.new(hash_key, digestmod=hashlib.sha256)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(path):
+    """Load a manifest, or return an empty one if there is none yet"""
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {'version': MANIFEST_VERSION, 'files': {}}
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise engine.CyberPHError(f"Unsupported manifest version: {manifest.get('version')}")
+    return manifest
+
+
+def save_manifest(path, manifest):
+    with engine.AtomicOutput(path) as f:
+        f.write(json.dumps(manifest, indent=1, sort_keys=True).encode())
+
+
+def iter_source_files(source_dir):
+    """Yield (path, relative_path) for every plaintext file under source_dir"""
+    for dirpath, dirnames, filenames in os.walk(source_dir):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.endswith(engine.ENCRYPTED_EXTENSION):
+                continue
+            path = os.path.join(dirpath, name)
+            yield path, os.path.relpath(path, source_dir).replace(os.sep, '/')
+
+
+def _output_path(output_dir, relative_path):
+    return os.path.join(output_dir, *relative_path.split('/')) + engine.ENCRYPTED_EXTENSION
+
+
+def sync_tree(source_dir, output_dir, password=None, key=None,
+              cipher=engine.DEFAULT_CIPHER, compress=compression.COMPRESSION_AUTO,
+              jobs=1, workers=1, on_result=None, on_removed=None, kdf=None, kdf_time=None,
+              metrics=None):
+    """Bring output_dir up to date with source_dir, returning a SyncSummary
+
+    A file is re-encrypted when it is new, its output is missing, or its
+    size or mtime changed and its content hash no longer matches. Outputs
+    whose source is gone are deleted. Changing the password or key
+    re-encrypts everything.
+
+    kdf is a KDF name or spec for password runs. The manifest's spec is
+    reused while the KDF name stays the same, so a later run derives the
+    same key; otherwise the spec is calibrated to kdf_time seconds when
+    given. on_result(path, output_path, error) is called for each file
+    encrypted, on_removed(output_path) for each output deleted. metrics
+    collects per-stage timings of the files encrypted.
+    """
+    if (password is None) == (key is None):
+        raise ValueError("Exactly one of password or key is required")
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+
+    salt = None
+    if password is not None:
+        kdf_name = kdf['name'] if isinstance(kdf, dict) else kdf
+        previous_kdf = manifest.get('kdf', LEGACY_KDF)
+        if 'salt' in manifest and kdf_name in (None, previous_kdf['name']):
+            # Reuse the manifest's salt and KDF so an unchanged password
+            # gives the same key and the entries stay valid
+            salt = base64.b64decode(manifest['salt'])
+            kdf = previous_kdf
+        elif kdf_time is not None:
+            kdf = calibrate(kdf_name or DEFAULT_KDF['name'], kdf_time)
+        else:
+            kdf = normalize_kdf(kdf)
+        key, salt = engine.derive_key(password, salt, kdf)
+
+    key_check = engine.key_check_value(key)
+    previous = manifest['files'] if manifest.get('key_check') == key_check else {}
+    hash_key = manifest_hash_key(key)
+
+    files = {}
+    seen = set()
+    pending = {}
+    items = []
+    summary = SyncSummary()
+    for path, relative_path in iter_source_files(source_dir):
+        seen.add(relative_path)
+        stat = os.stat(path)
+        output_path = _output_path(output_dir, relative_path)
+        entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        old = previous.get(relative_path)
+        if old is not None and os.path.exists(output_path):
+            if old['size'] == entry['size'] and old['mtime_ns'] == entry['mtime_ns']:
+                files[relative_path] = old
+                summary.unchanged += 1
+                continue
+            entry['hash'] = content_hash(path, hash_key)
+            if old['hash'] == entry['hash']:
+                # Touched but not modified
+                files[relative_path] = entry
+                summary.unchanged += 1
+                continue
+        else:
+            entry['hash'] = content_hash(path, hash_key)
+        if old is not None:
+            # Keep the old entry until the new output is in place
+            files[relative_path] = old
+        pending[path] = (relative_path, entry)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        items.append((path, output_path))
+
+    def record(path, output_path, error):
+        if error is None:
+            relative_path, entry = pending[path]
+            files[relative_path] = entry
+        if on_result is not None:
+            on_result(path, output_path, error)
+
+    result = batch.encrypt_files(items, key=key, salt=salt, cipher=cipher, compress=compress,
+                                 jobs=jobs, workers=workers, on_result=record, kdf=kdf,
+                                 metrics=metrics)
+
+    for relative_path in manifest['files'].keys() - seen:
+        output_path = _output_path(output_dir, relative_path)
+        try:
+            os.remove(output_path)
+        except FileNotFoundError:
+            pass
+        summary.removed += 1
+        if on_removed is not None:
+            on_removed(output_path)
+
+    manifest = {'version': MANIFEST_VERSION, 'key_check': key_check, 'files': files}
+    if salt is not None:
+        manifest['salt'] = base64.b64encode(salt).decode()
+        manifest['kdf'] = kdf
+    save_manifest(manifest_path, manifest)
+
+    summary.files = result.files
+    summary.succeeded = result.succeeded
+    summary.bytes_in = result.bytes_in
+    summary.bytes_out = result.bytes_out
+    summary.failures = result.failures
+    summary.finish()
+    return summary
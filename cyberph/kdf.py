@@ -0,0 +1,131 @@
+"""
+CyberPH key derivation
+Password-based KDFs (PBKDF2, scrypt and Argon2id where available) and a
+calibration routine that picks parameters for a target derive time.
+
+A KDF is described by a spec dict such as {'name': 'scrypt', 'n': 32768,
+'r': 8, 'p': 1}; the spec is stored in the file header so decryption
+reproduces the derivation exactly.
+"""
+
+import time
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+
+try:
+    from cryptography.hazmat.primitives.kdf.argon2 import Argon2id
+except ImportError:  # cryptography < 44
+    Argon2id = None
+
+KDF_PBKDF2 = 'pbkdf2-sha256'
+KDF_SCRYPT = 'scrypt'
+KDF_ARGON2ID = 'argon2id'
+KDFS = (KDF_PBKDF2, KDF_SCRYPT, KDF_ARGON2ID)
+KEY_LENGTH = 32
+
+# Files without a 'kdf' header field were derived with this spec
+LEGACY_KDF = {'name': KDF_PBKDF2, 'iterations': 100000}
+DEFAULT_KDF = LEGACY_KDF
+DEFAULT_TARGET_SECONDS = 0.5
+
+# Calibration never goes below these, however slow the machine
+_MINIMUM = {
+    KDF_PBKDF2: {'iterations': 50000},
+    KDF_SCRYPT: {'n': 2 ** 14, 'r': 8, 'p': 1},
+    # OWASP minimum for Argon2id: 19 MiB, 2 passes
+    KDF_ARGON2ID: {'iterations': 2, 'lanes': 1, 'memory_cost': 19 * 1024},
+}
+# Specs are read from file headers and the KDF runs before anything in the
+# file is authenticated, so cap them before deriving: a crafted header must
+# not be able to demand gigabytes of memory or minutes of CPU
+_MAXIMUM = {
+    KDF_PBKDF2: {'iterations': 10_000_000},
+    KDF_SCRYPT: {'n': 2 ** 20, 'r': 32, 'p': 16},
+    KDF_ARGON2ID: {'iterations': 1000, 'lanes': 64, 'memory_cost': 1024 * 1024},
+}
+# The per-parameter caps alone still multiply out to far too much, so the
+# actual cost is capped as well
+_MAX_MEMORY = 1024 ** 3  # bytes held at once
+_MAX_SCRYPT_WORK = 4 * 1024 ** 3  # 128 * n * r * p bytes mixed in total
+_MAX_ARGON2_WORK = 8 * 1024 * 1024  # memory_cost (KiB) * iterations
+_ARGON2_MEMORY_COST = 64 * 1024  # KiB
+_ARGON2_LANES = 4
+
+
+def available_kdfs():
+    """Return the names of the KDFs usable on this installation"""
+    return tuple(name for name in KDFS if name != KDF_ARGON2ID or Argon2id is not None)
+
+
+def normalize(spec):
+    """Return a complete spec for a KDF name or a (possibly partial) spec dict"""
+    if spec is None:
+        return dict(DEFAULT_KDF)
+    if isinstance(spec, str):
+        spec = {'name': spec}
+    name = spec.get('name')
+    if name not in available_kdfs():
+        raise ValueError(f"Unsupported KDF: {name}")
+    spec = {'name': name, **_MINIMUM[name], **spec}
+    for param, maximum in _MAXIMUM[name].items():
+        value = spec[param]
+        if not isinstance(value, int) or not 1 <= value <= maximum:
+            raise ValueError(f"Invalid {name} parameter {param}: {value}")
+    if name == KDF_SCRYPT:
+        memory = 128 * spec['n'] * spec['r']
+        if memory > _MAX_MEMORY or memory * spec['p'] > _MAX_SCRYPT_WORK:
+            raise ValueError(f"scrypt parameters are too expensive: {spec}")
+    elif name == KDF_ARGON2ID:
+        if spec['memory_cost'] * spec['iterations'] > _MAX_ARGON2_WORK:
+            raise ValueError(f"Argon2id parameters are too expensive: {spec}")
+    return spec
+
+
+def derive(password, salt, spec):
+    """Derive KEY_LENGTH raw bytes from password and salt with a KDF spec"""
+    spec = normalize(spec)
+    name = spec['name']
+    if name == KDF_PBKDF2:
+        kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=KEY_LENGTH, salt=salt,
+                         iterations=spec['iterations'])
+    elif name == KDF_SCRYPT:
+        kdf = Scrypt(salt=salt, length=KEY_LENGTH, n=spec['n'], r=spec['r'], p=spec['p'])
+    else:
+        kdf = Argon2id(salt=salt, length=KEY_LENGTH, iterations=spec['iterations'],
+                       lanes=spec['lanes'], memory_cost=spec['memory_cost'])
+    return kdf.derive(password.encode())
+
+
+def _time_derive(spec):
+    start = time.perf_counter()
+    derive('calibration', b'\0' * 16, spec)
+    return time.perf_counter() - start
+
+
+def calibrate(name=KDF_PBKDF2, target_seconds=DEFAULT_TARGET_SECONDS):
+    """Return a spec for the named KDF that takes about target_seconds here
+
+    PBKDF2 and Argon2id scale their iteration count; scrypt doubles its
+    work factor n, which also doubles its memory use. Results never drop
+    below the minimum parameters for the KDF, nor exceed what normalize()
+    accepts.
+    """
+    spec = normalize(name)
+    if name == KDF_PBKDF2:
+        seconds = _time_derive(spec)
+        iterations = int(spec['iterations'] * target_seconds / seconds)
+        spec['iterations'] = min(max(_MINIMUM[name]['iterations'], iterations),
+                                 _MAXIMUM[name]['iterations'])
+    elif name == KDF_SCRYPT:
+        while (128 * spec['n'] * 2 * spec['r'] <= _MAX_MEMORY
+               and _time_derive(spec) * 2 <= target_seconds):
+            spec['n'] *= 2
+    else:
+        spec.update(memory_cost=_ARGON2_MEMORY_COST, lanes=_ARGON2_LANES, iterations=1)
+        seconds = _time_derive(spec)
+        iterations = int(target_seconds / seconds)
+        spec['iterations'] = min(max(_MINIMUM[name]['iterations'], iterations),
+                                 _MAX_ARGON2_WORK // spec['memory_cost'])
+    return spec
@@ -0,0 +1,111 @@
+"""
+CyberPH derived-key cache
+Remembers keys derived from passwords, by salt and KDF spec, so reopening
+files from the same password skips the key derivation and the prompt.
+"""
+
+import json
+import time
+import base64
+import threading
+from collections import OrderedDict
+
+from .kdf import LEGACY_KDF
+
+DEFAULT_MAX_SIZE = 16
+DEFAULT_TTL = 15 * 60  # seconds
+
+
+class KeyCache:
+    """Bounded LRU cache of derived keys with a time-to-live
+
+    Keys are held in bytearrays that are zeroed when they are evicted,
+    expire or the cache is cleared. Copies handed out by get() are ordinary
+    bytes and are not wiped. Safe to share between threads.
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL, clock=time.monotonic):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def cache_key(salt, kdf):
+        return salt, json.dumps(kdf, sort_keys=True)
+
+    @staticmethod
+    def metadata_key(metadata):
+        """Cache key for a password-encrypted file's header, or None"""
+        if metadata.get('encryption_method', 'password') != "password" or 'salt' not in metadata:
+            return None
+        return KeyCache.cache_key(base64.b64decode(metadata['salt']),
+                                  metadata.get('kdf', LEGACY_KDF))
+
+    def __len__(self):
+        with self._lock:
+            self._expire()
+            return len(self._entries)
+
+    def get(self, salt, kdf):
+        """Return the cached key for salt and KDF spec, or None"""
+        return self._get(self.cache_key(salt, kdf))
+
+    def put(self, salt, kdf, key):
+        """Cache key as derived from salt with KDF spec kdf"""
+        self._put(self.cache_key(salt, kdf), key)
+
+    def key_for(self, metadata):
+        """Return the cached key for a file's header, or None"""
+        cache_key = self.metadata_key(metadata)
+        return None if cache_key is None else self._get(cache_key)
+
+    def add_for(self, metadata, key):
+        """Cache the key derived for a file's header"""
+        cache_key = self.metadata_key(metadata)
+        if cache_key is not None:
+            self._put(cache_key, key)
+
+    def discard_for(self, metadata):
+        """Wipe and forget the key cached for a file's header, if any"""
+        cache_key = self.metadata_key(metadata)
+        with self._lock:
+            if cache_key in self._entries:
+                self._evict(cache_key)
+
+    def clear(self):
+        """Wipe and forget every cached key"""
+        with self._lock:
+            while self._entries:
+                self._evict(next(iter(self._entries)))
+
+    def _get(self, cache_key):
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(cache_key)
+            return bytes(entry[0])
+
+    def _put(self, cache_key, key):
+        with self._lock:
+            if cache_key in self._entries:
+                self._evict(cache_key)
+            self._entries[cache_key] = (bytearray(key), self._clock() + self.ttl)
+            self._expire()
+            while len(self._entries) > self.max_size:
+                self._evict(next(iter(self._entries)))
+
+    def _expire(self):
+        now = self._clock()
+        for cache_key in [cache_key for cache_key, (_, expires) in self._entries.items()
+                          if expires <= now]:
+            self._evict(cache_key)
+
+    def _evict(self, cache_key):
+        key, _ = self._entries.pop(cache_key)
+        key[:] = bytes(len(key))
@@ -0,0 +1,70 @@
+"""
+CyberPH keyring
+Holds many encryption keys indexed by fingerprint, so the key for a .cyberph
+file is found with one lookup instead of trying keys one by one.
+"""
+
+import os
+
+from . import engine
+
+
+class KeyRing:
+    """In-memory map of key fingerprint -> key"""
+
+    def __init__(self, keys=()):
+        self._keys = {}
+        for key in keys:
+            self.add(key)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, fingerprint):
+        return fingerprint in self._keys
+
+    def add(self, key):
+        """Add a key, returning its fingerprint"""
+        fingerprint = engine.key_fingerprint(engine.validate_key(key))
+        self._keys[fingerprint] = key
+        return fingerprint
+
+    def load_file(self, path):
+        """Add the key from an exported JSON key file or a _raw.key file"""
+        return self.add(engine.load_key(path))
+
+    def load(self, path):
+        """Add keys from a key file or every *.key file under a directory
+
+        Exported JSON files and their _raw.key copies hold the same key and
+        collapse to one entry. Returns the number of key files loaded.
+        """
+        if not os.path.isdir(path):
+            self.load_file(path)
+            return 1
+
+        loaded = 0
+        for dirpath, _, filenames in os.walk(path):
+            for name in sorted(filenames):
+                if not name.endswith('.key'):
+                    continue
+                try:
+                    self.load_file(os.path.join(dirpath, name))
+                    loaded += 1
+                except (OSError, ValueError):
+                    continue
+        return loaded
+
+    def get(self, fingerprint):
+        """Return the key with this fingerprint, or None"""
+        return self._keys.get(fingerprint)
+
+    def key_for(self, metadata):
+        """Return the key needed for a .cyberph file, given its metadata"""
+        fingerprint = metadata.get('key_fingerprint')
+        if fingerprint is None:
+            raise engine.CyberPHError("File has no key fingerprint; import its key directly")
+        key = self._keys.get(fingerprint)
+        if key is None:
+            raise engine.CyberPHError(f"No key with fingerprint {fingerprint} in the keyring")
+        return key
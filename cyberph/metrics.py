@@ -0,0 +1,218 @@
+"""
+CyberPH metrics
+Per-stage timings and byte counts for encrypt/decrypt runs (read, KDF,
+compress, cipher, write and the total), exportable as JSON lines or in the
+Prometheus text format.
+
+Pass a Metrics object as metrics= to the engine; without one nothing is
+measured and the hot paths are unchanged.
+"""
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+STAGE_READ = 'read'
+STAGE_KDF = 'kdf'
+STAGE_COMPRESS = 'compress'
+STAGE_CIPHER = 'cipher'
+STAGE_WRITE = 'write'
+STAGE_TOTAL = 'total'
+STAGES = (STAGE_READ, STAGE_KDF, STAGE_COMPRESS, STAGE_CIPHER, STAGE_WRITE, STAGE_TOTAL)
+
+PROMETHEUS_PREFIX = 'cyberph'
+
+
+class Metrics:
+    """Accumulated seconds, bytes and calls per stage
+
+    Compress and cipher work runs on worker threads, so their seconds are
+    summed across threads and can exceed the wall-clock total.
+    """
+
+    def __init__(self, operation=None, labels=None):
+        self.operation = operation
+        self.labels = dict(labels or {})
+        self.files = 0
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds, nbytes=0, calls=1):
+        with self._lock:
+            stats = self.stages.setdefault(stage, {'seconds': 0.0, 'bytes': 0, 'calls': 0})
+            stats['seconds'] += seconds
+            stats['bytes'] += nbytes
+            stats['calls'] += calls
+            if stage == STAGE_TOTAL:
+                self.files += calls
+
+    @contextmanager
+    def stage(self, stage, nbytes=0):
+        """Time the enclosed block as one call of stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start, nbytes)
+
+    def merge(self, other):
+        """Add the stages of another Metrics, or of its as_dict()"""
+        stages = other['stages'] if isinstance(other, dict) else other.stages
+        for stage, stats in stages.items():
+            self.add(stage, stats['seconds'], stats['bytes'], stats['calls'])
+
+    def as_dict(self):
+        with self._lock:
+            stages = {}
+            for stage in sorted(self.stages, key=_stage_order):
+                stats = self.stages[stage]
+                stages[stage] = {
+                    'seconds': round(stats['seconds'], 6),
+                    'bytes': stats['bytes'],
+                    'calls': stats['calls'],
+                    'mb_per_s': _throughput(stats) and round(_throughput(stats) / 1024 ** 2, 2),
+                }
+            return {
+                'timestamp': datetime.now().isoformat(timespec='milliseconds'),
+                'operation': self.operation,
+                'labels': self.labels,
+                'files': self.files,
+                'stages': stages,
+            }
+
+    def to_json_line(self):
+        return json.dumps(self.as_dict())
+
+    def append_jsonl(self, path):
+        """Append this run as one JSON line to path"""
+        with open(path, 'a') as f:
+            f.write(self.to_json_line() + '\n')
+
+    def to_prometheus(self):
+        """Render the metrics in the Prometheus text exposition format"""
+        data = self.as_dict()
+        labels = dict(self.labels)
+        if self.operation is not None:
+            labels['operation'] = self.operation
+        families = (
+            ('stage_seconds_total', 'counter', "Time spent per stage", 'seconds'),
+            ('stage_bytes_total', 'counter', "Bytes processed per stage", 'bytes'),
+            ('stage_calls_total', 'counter', "Calls timed per stage", 'calls'),
+            ('stage_throughput_bytes_per_second', 'gauge', "Bytes per second per stage", None),
+        )
+        lines = []
+        for name, kind, help_text, field in families:
+            metric = f"{PROMETHEUS_PREFIX}_{name}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for stage, stats in data['stages'].items():
+                if field is None and not stats['bytes']:
+                    continue
+                value = stats[field] if field else _throughput(self.stages[stage])
+                lines.append(f"{metric}{_format_labels({**labels, 'stage': stage})} {value}")
+        metric = f"{PROMETHEUS_PREFIX}_files_total"
+        lines.append(f"# HELP {metric} Files processed")
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric}{_format_labels(labels)} {self.files}")
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """Write the metrics to path, e.g. for the node_exporter textfile collector"""
+        with open(path + '.part', 'w') as f:
+            f.write(self.to_prometheus())
+        # Collectors must never see a half-written file
+        os.replace(path + '.part', path)
+
+    def __str__(self):
+        parts = []
+        for stage, stats in self.as_dict()['stages'].items():
+            part = f"{stage} {stats['seconds']:.3f}s"
+            if stats['mb_per_s']:
+                part += f" ({stats['mb_per_s']:.1f} MB/s)"
+            parts.append(part)
+        return ', '.join(parts)
+
+
+def _stage_order(stage):
+    return STAGES.index(stage) if stage in STAGES else len(STAGES)
+
+
+def _throughput(stats):
+    if not stats['bytes'] or not stats['seconds']:
+        return 0.0
+    return stats['bytes'] / stats['seconds']
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = (f'{name}="{_escape_label(value)}"' for name, value in sorted(labels.items()))
+    return '{' + ','.join(pairs) + '}'
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def timed(metrics, stage, nbytes=0):
+    """metrics.stage(...) if metrics is given, else a no-op context"""
+    return nullcontext() if metrics is None else metrics.stage(stage, nbytes)
+
+
+class TimedReader:
+    """Wrap a readable stream, timing reads as the read stage"""
+
+    def __init__(self, src, metrics):
+        self.src = src
+        self.metrics = metrics
+
+    def read(self, size=-1):
+        start = time.perf_counter()
+        data = self.src.read(size)
+        self.metrics.add(STAGE_READ, time.perf_counter() - start, len(data))
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.src, name)
+
+
+class TimedWriter:
+    """Wrap a writable stream, timing writes as the write stage"""
+
+    def __init__(self, dst, metrics):
+        self.dst = dst
+        self.metrics = metrics
+
+    def write(self, data):
+        start = time.perf_counter()
+        written = self.dst.write(data)
+        self.metrics.add(STAGE_WRITE, time.perf_counter() - start, len(data))
+        return written
+
+    def __getattr__(self, name):
+        return getattr(self.dst, name)
+
+
+class TimedChunkCipher:
+    """Wrap a chunk cipher, timing sealing and opening as the cipher stage"""
+
+    def __init__(self, cipher, metrics):
+        self.cipher = cipher
+        self.metrics = metrics
+
+    def encrypt(self, index, final, chunk):
+        with self.metrics.stage(STAGE_CIPHER, len(chunk)):
+            return self.cipher.encrypt(index, final, chunk)
+
+    def decrypt(self, index, final, sealed):
+        with self.metrics.stage(STAGE_CIPHER, len(sealed)):
+            return self.cipher.decrypt(index, final, sealed)
+
+    def encrypt_index(self, count, data):
+        return self.cipher.encrypt_index(count, data)
+
+    def decrypt_index(self, count, sealed):
+        return self.cipher.decrypt_index(count, sealed)
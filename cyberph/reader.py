@@ -0,0 +1,103 @@
+"""
+CyberPH random-access reader
+Decrypt arbitrary byte ranges of a v2 .cyberph file, reading and
+authenticating only the chunks that cover the range.
+"""
+
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import InvalidToken
+
+from . import engine
+
+
+class EncryptedReader:
+    """Random-access view of the plaintext of a .cyberph file
+
+    Use as a context manager:
+
+        with EncryptedReader(path, password=password) as reader:
+            data = reader.read(offset, length)
+    """
+
+    def __init__(self, path, password=None, key=None, keyring=None, key_cache=None):
+        self.file = open(path, 'rb')
+        try:
+            self.metadata, metadata_json = engine.read_header(self.file)
+            if engine.format_version(self.metadata) < 2:
+                raise engine.CyberPHError("Range reads need a v2 .cyberph file")
+            if self.metadata.get('bundle'):
+                raise engine.CyberPHError("Range reads are not supported on bundles")
+            self.payload_start = self.file.tell()
+            self.chunk_size = self.metadata['chunk_size']
+            key = engine.resolve_key(self.metadata, password, key, keyring, key_cache)
+            self.cipher = engine.make_chunk_cipher(self.metadata, metadata_json, key)
+            self.size, self.offsets = self._load_index()
+        except Exception:
+            self.file.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def close(self):
+        self.file.close()
+
+    def _load_index(self):
+        """Return (plaintext size, frame offsets) from the trailer or a frame scan"""
+        if self.metadata.get('chunk_index'):
+            try:
+                return engine.read_chunk_index(self.cipher, self.file)
+            except (InvalidToken, InvalidTag):
+                raise engine.DecryptionError("Chunk index failed authentication")
+
+        # Files written without an index: walk the frame headers, seeking
+        # past each sealed chunk without reading it
+        self.file.seek(self.payload_start)
+        offsets = []
+        while True:
+            offsets.append(self.file.tell() - self.payload_start)
+            if engine.skip_frame(self.file):
+                break
+        size = self.metadata.get('file_size')
+        if size is None:
+            size = (len(offsets) - 1) * self.chunk_size + len(self.read_chunk(len(offsets) - 1))
+        return size, offsets
+
+    def read_chunk(self, index):
+        """Read, authenticate and decrypt one chunk"""
+        self.file.seek(self.payload_start + self.offsets[index])
+        final, sealed = engine.read_frame(self.file)
+        if final != (index == len(self.offsets) - 1):
+            raise engine.DecryptionError("Chunk index does not match the payload")
+        try:
+            return self.cipher.decrypt(index, final, sealed)
+        except (InvalidToken, InvalidTag):
+            raise engine.DecryptionError(f"Chunk {index} failed authentication")
+
+    def iter_range(self, offset=0, length=None):
+        """Yield the plaintext from offset, for length bytes or to the end, chunk by chunk"""
+        if offset < 0:
+            raise ValueError("Offset must not be negative")
+        end = self.size if length is None else min(self.size, offset + length)
+        position = offset
+        while position < end:
+            index = position // self.chunk_size
+            chunk_start = index * self.chunk_size
+            chunk = self.read_chunk(index)
+            yield chunk[position - chunk_start:end - chunk_start]
+            position = chunk_start + self.chunk_size
+
+    def read(self, offset=0, length=None):
+        """Return the plaintext bytes in [offset, offset + length)"""
+        return b''.join(self.iter_range(offset, length))
+
+
+def read_range(path, offset=0, length=None, password=None, key=None, keyring=None,
+               key_cache=None):
+    """Decrypt and return length bytes of plaintext starting at offset"""
+    with EncryptedReader(path, password, key, keyring, key_cache) as reader:
+        return reader.read(offset, length)
@@ -0,0 +1,253 @@
+"""
+CyberPH folder watcher
+Long-running service that encrypts files dropped into an inbox directory.
+
+The inbox is polled; a file is picked up once its size and mtime have been
+stable for a settle time, so files still being written (by a scanner or a
+copy) are left alone. Ready files go through a bounded queue to a pool of
+worker threads. When the queue is full the scanner waits, so a burst of
+files never piles up in memory. Each file is encrypted with the current key;
+the output is synced to disk and verified before the plaintext is removed
+or moved aside. Failures are retried with a delay; shutdown lets running
+files finish.
+"""
+
+import os
+import time
+import queue
+import shutil
+import threading
+
+from . import compression, engine
+
+AFTER_REMOVE = 'remove'
+AFTER_MOVE = 'move'
+# Names used for files that are still being written
+IGNORED_SUFFIXES = ('.part', '.tmp', '.crdownload', engine.ENCRYPTED_EXTENSION)
+
+
+class FolderWatcher:
+    """Encrypt every file that appears in inbox into output_dir
+
+    on_event(kind, path, detail) is called from the scanner and worker
+    threads with kind 'queued', 'encrypted', 'retry', 'failed' or 'stopped'.
+    """
+
+    def __init__(self, inbox, output_dir, key, after=AFTER_REMOVE, done_dir=None,
+                 failed_dir=None, jobs=2, queue_size=16, poll_interval=1.0, settle_time=2.0,
+                 max_attempts=3, retry_delay=10.0, cipher=engine.DEFAULT_CIPHER,
+                 compress=compression.COMPRESSION_AUTO, workers=1, on_event=None):
+        if after not in (AFTER_REMOVE, AFTER_MOVE):
+            raise ValueError(f"Unsupported action after encryption: {after}")
+        if after == AFTER_MOVE and done_dir is None:
+            raise ValueError("done_dir is required to move encrypted plaintext")
+        self.inbox = inbox
+        self.output_dir = output_dir
+        self.key = engine.validate_key(key)
+        self.after = after
+        self.done_dir = done_dir
+        self.failed_dir = failed_dir
+        self.jobs = jobs
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.cipher = engine.select_cipher(cipher)
+        self.compress = compress
+        self.workers = workers
+        self.on_event = on_event
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        # path -> (size, mtime_ns, time first seen with that size and mtime)
+        self._candidates = {}
+        # Paths queued or being encrypted
+        self._in_flight = set()
+        # Output paths reserved by workers that are encrypting into them
+        self._outputs = set()
+        # path -> (attempts so far, earliest retry time, (size, mtime_ns))
+        self._failures = {}
+        self._threads = []
+
+    def _emit(self, kind, path, detail=None):
+        if self.on_event is not None:
+            self.on_event(kind, path, detail)
+
+    def stop(self):
+        """Ask the watcher to stop; files being encrypted are finished first"""
+        self._stopping.set()
+
+    def run(self):
+        """Watch the inbox until stop() is called"""
+        for directory in (self.output_dir, self.done_dir, self.failed_dir):
+            if directory is not None:
+                os.makedirs(directory, exist_ok=True)
+        self._threads = [threading.Thread(target=self._worker, name=f"cyberph-watch-{n}",
+                                          daemon=True)
+                         for n in range(self.jobs)]
+        for thread in self._threads:
+            thread.start()
+        try:
+            while not self._stopping.is_set():
+                for path in self.scan():
+                    if not self._enqueue(path):
+                        break
+                self._stopping.wait(self.poll_interval)
+        finally:
+            self._stopping.set()
+            for thread in self._threads:
+                thread.join()
+            self._emit('stopped', self.inbox)
+
+    def scan(self, now=None):
+        """Return inbox files that are complete and not already being handled"""
+        now = time.monotonic() if now is None else now
+        ready = []
+        seen = set()
+        with os.scandir(self.inbox) as entries:
+            for entry in entries:
+                if (entry.name.startswith('.') or entry.name.endswith(IGNORED_SUFFIXES)
+                        or not entry.is_file(follow_symlinks=False)):
+                    continue
+                path = entry.path
+                seen.add(path)
+                stat = entry.stat(follow_symlinks=False)
+                state = (stat.st_size, stat.st_mtime_ns)
+                with self._lock:
+                    if path in self._in_flight:
+                        continue
+                    failure = self._failures.get(path)
+                    if failure is not None:
+                        attempts, retry_at, failed_state = failure
+                        if failed_state == state and (attempts >= self.max_attempts
+                                                      or now < retry_at):
+                            continue
+                previous = self._candidates.get(path)
+                if previous is None or previous[:2] != state:
+                    self._candidates[path] = (*state, now)
+                elif now - previous[2] >= self.settle_time:
+                    ready.append(path)
+
+        for path in self._candidates.keys() - seen:
+            del self._candidates[path]
+        with self._lock:
+            for path in self._failures.keys() - seen:
+                del self._failures[path]
+        return ready
+
+    def _enqueue(self, path):
+        """Queue path, waiting while the queue is full; False if stopping"""
+        with self._lock:
+            self._in_flight.add(path)
+        while not self._stopping.is_set():
+            try:
+                self.queue.put(path, timeout=self.poll_interval)
+            except queue.Full:
+                continue
+            self._candidates.pop(path, None)
+            self._emit('queued', path)
+            return True
+        with self._lock:
+            self._in_flight.discard(path)
+        return False
+
+    def _worker(self):
+        while True:
+            try:
+                path = self.queue.get(timeout=self.poll_interval)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    return
+                continue
+            try:
+                if self._stopping.is_set():
+                    # Not started yet: leave it in the inbox for the next run
+                    continue
+                self._process(path)
+            finally:
+                with self._lock:
+                    self._in_flight.discard(path)
+                self.queue.task_done()
+
+    def _process(self, path):
+        output_path = None
+        try:
+            stat = os.stat(path)
+            output_path = self._output_path(os.path.basename(path))
+            # The plaintext is deleted next, so the output must be on disk
+            # and readable first
+            engine.encrypt_file(path, output_path, key=self.key, cipher=self.cipher,
+                                compress=self.compress, workers=self.workers, fsync=True)
+            if os.stat(path).st_mtime_ns != stat.st_mtime_ns:
+                os.remove(output_path)
+                raise engine.CyberPHError("File changed while it was being encrypted")
+            try:
+                engine.verify_file(output_path, key=self.key, workers=self.workers)
+            except engine.CyberPHError:
+                os.remove(output_path)
+                raise
+            self._dispose(path)
+        except Exception as e:
+            self._failed(path, e)
+            return
+        finally:
+            with self._lock:
+                self._outputs.discard(output_path)
+        with self._lock:
+            self._failures.pop(path, None)
+        self._emit('encrypted', path, output_path)
+
+    def _output_path(self, name):
+        """Reserve a free output path for name, numbering repeats of the same name
+
+        Workers pick names concurrently, so the choice is made under the lock
+        and the path stays reserved until _process releases it.
+        """
+        base = os.path.join(self.output_dir, name)
+        output_path = base + engine.ENCRYPTED_EXTENSION
+        stem, ext = os.path.splitext(base)
+        number = 1
+        with self._lock:
+            while (output_path in self._outputs or os.path.exists(output_path)
+                   or os.path.exists(output_path + '.part')):
+                output_path = f"{stem}-{number}{ext}{engine.ENCRYPTED_EXTENSION}"
+                number += 1
+            self._outputs.add(output_path)
+        return output_path
+
+    def _dispose(self, path):
+        """Remove the plaintext, or move it to done_dir"""
+        if self.after == AFTER_REMOVE:
+            os.remove(path)
+        else:
+            shutil.move(path, _free_path(self.done_dir, os.path.basename(path)))
+
+    def _failed(self, path, error):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            # Gone: nothing left to retry
+            self._emit('failed', path, error)
+            return
+        with self._lock:
+            attempts = self._failures.get(path, (0, 0, None))[0] + 1
+            self._failures[path] = (attempts, time.monotonic() + self.retry_delay,
+                                    (stat.st_size, stat.st_mtime_ns))
+        if attempts < self.max_attempts:
+            self._emit('retry', path, error)
+            return
+        self._emit('failed', path, error)
+        if self.failed_dir is not None:
+            shutil.move(path, _free_path(self.failed_dir, os.path.basename(path)))
+
+
+def _free_path(directory, name):
+    """directory/name, numbered if a file of that name already exists"""
+    path = os.path.join(directory, name)
+    stem, ext = os.path.splitext(path)
+    number = 1
+    while os.path.exists(path):
+        path = f"{stem}-{number}{ext}"
+        number += 1
+    return path
@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cyberph import engine
+
+# Small chunks keep multi-chunk files tiny; a cheap KDF keeps password tests fast
+CHUNK_SIZE = 4096
+FAST_KDF = {'name': 'pbkdf2-sha256', 'iterations': 1000}
+
+
+@pytest.fixture
+def key():
+    return engine.generate_key()
+
+
+@pytest.fixture
+def plaintext():
+    """Three and a bit chunks: compressible text followed by random bytes"""
+    text = b''.join(b'line %d of some log text\n' % i for i in range(400))
+    return (text + os.urandom(3 * CHUNK_SIZE))[:3 * CHUNK_SIZE + 100]
+
+
+def write_file(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return str(path)
+
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+from cyberph import batch, bundle, engine
+
+from conftest import read_file, write_file
+
+
+@pytest.fixture
+def same_names(tmp_path):
+    """Two inputs called x in different directories"""
+    paths = []
+    for directory, data in (('d1', b'first'), ('d2', b'second')):
+        os.mkdir(tmp_path / directory)
+        paths.append(write_file(tmp_path / directory / 'x', data))
+    return paths
+
+
+def test_encrypt_files(tmp_path, same_names, key):
+    items = [(path, None) for path in same_names]
+    summary = batch.encrypt_files(items, key=key, jobs=2)
+    assert not summary.failures
+    for path in same_names:
+        decrypted, _ = engine.decrypt_file(path + engine.ENCRYPTED_EXTENSION,
+                                           path + '.out', key=key)
+        assert read_file(decrypted) == read_file(path)
+
+
+def test_duplicate_batch_outputs_are_refused(tmp_path, same_names, key):
+    output_path = str(tmp_path / 'x.cyberph')
+    with pytest.raises(engine.CyberPHError):
+        batch.encrypt_files([(path, output_path) for path in same_names], key=key)
+    assert not os.path.exists(output_path)
+
+
+def test_duplicate_default_outputs_are_refused(same_names, key):
+    items = [(same_names[0], None), (same_names[1], same_names[0] + engine.ENCRYPTED_EXTENSION)]
+    with pytest.raises(engine.CyberPHError):
+        batch.encrypt_files(items, key=key)
+
+
+def test_duplicate_decrypt_outputs_are_refused(tmp_path, same_names, key):
+    batch.encrypt_files([(path, None) for path in same_names], key=key)
+    items = [(path + engine.ENCRYPTED_EXTENSION, str(tmp_path / 'x')) for path in same_names]
+    with pytest.raises(engine.CyberPHError):
+        batch.decrypt_files(items, key=key)
+
+
+def test_bundle_round_trip(tmp_path, same_names, key):
+    bundle_path = str(tmp_path / 'b.cyberph')
+    bundle.create_bundle(bundle_path, [(same_names[0], 'd1/x'), (same_names[1], 'd2/x')],
+                         key=key)
+    assert [member.path for member in bundle.list_bundle(bundle_path, key=key)] == ['d1/x', 'd2/x']
+    bundle.extract_bundle(bundle_path, str(tmp_path / 'out'), key=key)
+    for directory, path in zip(('d1', 'd2'), same_names):
+        assert read_file(tmp_path / 'out' / directory / 'x') == read_file(path)
+
+
+@pytest.mark.parametrize('names', [('x', 'x'), ('x', './x'), ('a/x', 'a//x')])
+def test_duplicate_bundle_members_are_refused(tmp_path, same_names, key, names):
+    bundle_path = str(tmp_path / 'b.cyberph')
+    with pytest.raises(engine.CyberPHError):
+        bundle.create_bundle(bundle_path, list(zip(same_names, names)), key=key)
+    assert not os.path.exists(bundle_path)
+
+
+@pytest.mark.parametrize('name', ['../x', 'a/../../x', ''])
+def test_unsafe_bundle_members_are_refused(tmp_path, same_names, key, name):
+    with pytest.raises(engine.CyberPHError):
+        bundle.create_bundle(str(tmp_path / 'b.cyberph'), [(same_names[0], name)], key=key)
@@ -0,0 +1,93 @@
+import os
+import threading
+
+import pytest
+
+from cyberph import checkpoint, engine
+
+from conftest import CHUNK_SIZE, FAST_KDF, read_file, write_file
+
+
+def interrupt(input_path, stop_after, **kwargs):
+    """Start a checkpointed encryption and cancel it after stop_after bytes"""
+    cancel = threading.Event()
+
+    def progress(done, total):
+        if done >= stop_after:
+            cancel.set()
+
+    with pytest.raises(engine.OperationCancelled):
+        checkpoint.encrypt_file_resumable(
+            input_path, chunk_size=CHUNK_SIZE, workers=2, progress=progress, cancel=cancel,
+            checkpoint_interval=2 * CHUNK_SIZE, **kwargs)
+
+
+def resume(input_path, **kwargs):
+    """Finish a checkpointed encryption, returning the first progress report"""
+    done = []
+    output_path, _ = checkpoint.encrypt_file_resumable(
+        input_path, chunk_size=CHUNK_SIZE, workers=2,
+        progress=lambda bytes_done, total: done.append(bytes_done), **kwargs)
+    return output_path, done[0]
+
+
+@pytest.fixture
+def large_input(tmp_path):
+    data = os.urandom(10 * CHUNK_SIZE) + b'a' * (10 * CHUNK_SIZE + 7)
+    return write_file(tmp_path / 'big.bin', data), data
+
+
+@pytest.mark.parametrize('cipher', engine.CIPHERS)
+def test_interrupted_encrypt_resumes(tmp_path, large_input, key, cipher):
+    input_path, data = large_input
+    output_path = input_path + engine.ENCRYPTED_EXTENSION
+    interrupt(input_path, 7 * CHUNK_SIZE, key=key, cipher=cipher)
+    assert not os.path.exists(output_path)
+    assert os.path.exists(output_path + '.part')
+    assert os.path.exists(checkpoint.checkpoint_path(output_path))
+
+    output_path, first = resume(input_path, key=key, cipher=cipher)
+    # The first report covers the checkpointed chunks plus the one after them
+    assert first > CHUNK_SIZE
+    assert not os.path.exists(output_path + '.part')
+    assert not os.path.exists(checkpoint.checkpoint_path(output_path))
+    decrypted, _ = engine.decrypt_file(output_path, str(tmp_path / 'out'), key=key)
+    assert read_file(decrypted) == data
+
+
+def test_resume_with_password(tmp_path, large_input):
+    input_path, data = large_input
+    interrupt(input_path, 7 * CHUNK_SIZE, password='secret', kdf=FAST_KDF, compress='zlib')
+    output_path, first = resume(input_path, password='secret', kdf=FAST_KDF, compress='zlib')
+    assert first > CHUNK_SIZE
+    decrypted, _ = engine.decrypt_file(output_path, str(tmp_path / 'out'), password='secret')
+    assert read_file(decrypted) == data
+
+
+def test_changed_input_starts_over(tmp_path, large_input, key):
+    input_path, _ = large_input
+    interrupt(input_path, 7 * CHUNK_SIZE, key=key)
+    data = os.urandom(15 * CHUNK_SIZE)
+    write_file(input_path, data)
+    output_path, first = resume(input_path, key=key)
+    assert first == CHUNK_SIZE
+    decrypted, _ = engine.decrypt_file(output_path, str(tmp_path / 'out'), key=key)
+    assert read_file(decrypted) == data
+
+
+def test_other_credentials_start_over(tmp_path, large_input, key):
+    input_path, data = large_input
+    interrupt(input_path, 7 * CHUNK_SIZE, key=key)
+    other_key = engine.generate_key()
+    output_path, first = resume(input_path, key=other_key)
+    assert first == CHUNK_SIZE
+    engine.verify_file(output_path, key=other_key)
+
+
+def test_discard_checkpoint_removes_leftovers(tmp_path, large_input, key):
+    input_path, _ = large_input
+    output_path = input_path + engine.ENCRYPTED_EXTENSION
+    interrupt(input_path, 7 * CHUNK_SIZE, key=key)
+    write_file(output_path + checkpoint.CHECKPOINT_TEMP_SUFFIX, b'{')
+    checkpoint.discard_checkpoint(output_path)
+    assert sorted(os.listdir(tmp_path)) == ['big.bin']
@@ -0,0 +1,177 @@
+import json
+import base64
+
+import pytest
+from cryptography.fernet import Fernet
+
+from cyberph import compression, engine
+from cyberph.reader import EncryptedReader, read_range
+
+from conftest import CHUNK_SIZE, FAST_KDF, read_file, write_file
+
+
+def encrypt(tmp_path, data, **kwargs):
+    path = write_file(tmp_path / 'plain', data)
+    kwargs.setdefault('compress', None)
+    output_path, _ = engine.encrypt_file(path, chunk_size=CHUNK_SIZE, workers=2, **kwargs)
+    return output_path
+
+
+def split_frames(path):
+    """Return (header, frames, trailer) of a v2 file as raw bytes"""
+    data = read_file(path)
+    with open(path, 'rb') as f:
+        engine.read_header(f)
+        header_size = f.tell()
+        frames = []
+        while True:
+            start = f.tell()
+            final, _ = engine.read_frame(f)
+            frames.append(data[start:f.tell()])
+            if final:
+                break
+        trailer = data[f.tell():]
+    return data[:header_size], frames, trailer
+
+
+@pytest.mark.parametrize('compress', compression.COMPRESSION_MODES)
+@pytest.mark.parametrize('cipher', engine.CIPHERS)
+def test_round_trip(tmp_path, key, plaintext, cipher, compress):
+    output_path = encrypt(tmp_path, plaintext, key=key, cipher=cipher, compress=compress)
+    metadata = engine.read_file_metadata(output_path)
+    assert metadata['cipher'] == cipher
+    engine.verify_file(output_path, key=key)
+    decrypted, _ = engine.decrypt_file(output_path, str(tmp_path / 'out'), key=key, workers=3)
+    assert read_file(decrypted) == plaintext
+
+
+@pytest.mark.parametrize('data', [b'', b'x', b'y' * CHUNK_SIZE], ids=['empty', 'byte', 'chunk'])
+def test_round_trip_sizes(tmp_path, key, data):
+    output_path = encrypt(tmp_path, data, key=key)
+    decrypted, _ = engine.decrypt_file(output_path, str(tmp_path / 'out'), key=key)
+    assert read_file(decrypted) == data
+
+
+def test_password_round_trip(tmp_path, plaintext):
+    output_path = encrypt(tmp_path, plaintext, password='secret', kdf=FAST_KDF)
+    decrypted, _ = engine.decrypt_file(output_path, str(tmp_path / 'out'), password='secret')
+    assert read_file(decrypted) == plaintext
+    with pytest.raises(engine.DecryptionError):
+        engine.decrypt_file(output_path, str(tmp_path / 'bad'), password='wrong')
+    assert not (tmp_path / 'bad').exists()
+
+
+def test_wrong_key_leaves_no_output(tmp_path, key, plaintext):
+    output_path = encrypt(tmp_path, plaintext, key=key)
+    with pytest.raises(engine.DecryptionError):
+        engine.decrypt_file(output_path, str(tmp_path / 'out'), key=engine.generate_key())
+    assert not (tmp_path / 'out').exists()
+    assert not (tmp_path / 'out.part').exists()
+
+
+def write_v1(path, data, key, salt=None):
+    """Write a file as the 1.0 release did: a JSON header and one Fernet token"""
+    metadata = {
+        'original_filename': 'plain',
+        'file_size': len(data),
+        'encryption_timestamp': '2024-01-01 00:00:00',
+        'encryption_method': 'key' if salt is None else 'password',
+        'version': '1.0',
+    }
+    if salt is not None:
+        metadata['salt'] = base64.b64encode(salt).decode()
+    with open(path, 'wb') as f:
+        engine.write_metadata(f, metadata)
+        f.write(Fernet(key).encrypt(data))
+    return str(path)
+
+
+def test_v1_key_file(tmp_path, key, plaintext):
+    path = write_v1(tmp_path / 'old.cyberph', plaintext, key)
+    decrypted, metadata = engine.decrypt_file(path, str(tmp_path / 'out'), key=key)
+    assert engine.format_version(metadata) == 1
+    assert read_file(decrypted) == plaintext
+    engine.verify_file(path, key=key)
+
+
+def test_v1_password_file(tmp_path, plaintext):
+    key, salt = engine.derive_key('secret')
+    path = write_v1(tmp_path / 'old.cyberph', plaintext, key, salt)
+    decrypted, _ = engine.decrypt_file(path, str(tmp_path / 'out'), password='secret')
+    assert read_file(decrypted) == plaintext
+    with pytest.raises(engine.DecryptionError):
+        engine.verify_file(path, password='wrong')
+
+
+@pytest.mark.parametrize('cipher', engine.CIPHERS)
+def test_truncated_file_fails(tmp_path, key, plaintext, cipher):
+    output_path = encrypt(tmp_path, plaintext, key=key, cipher=cipher)
+    header, frames, _ = split_frames(output_path)
+    # Dropping the final frame and trailer leaves a valid-looking prefix
+    write_file(output_path, header + b''.join(frames[:-1]))
+    with pytest.raises(engine.CyberPHError):
+        engine.decrypt_file(output_path, str(tmp_path / 'out'), key=key)
+    with pytest.raises(engine.CyberPHError):
+        engine.verify_file(output_path, key=key)
+    assert not (tmp_path / 'out').exists()
+
+
+@pytest.mark.parametrize('cipher', engine.CIPHERS)
+def test_reordered_chunks_fail(tmp_path, key, plaintext, cipher):
+    output_path = encrypt(tmp_path, plaintext, key=key, cipher=cipher)
+    header, frames, trailer = split_frames(output_path)
+    frames[0], frames[1] = frames[1], frames[0]
+    write_file(output_path, header + b''.join(frames) + trailer)
+    with pytest.raises(engine.DecryptionError):
+        engine.decrypt_file(output_path, str(tmp_path / 'out'), key=key)
+
+
+@pytest.mark.parametrize('cipher', engine.CIPHERS)
+def test_flipped_byte_fails(tmp_path, key, plaintext, cipher):
+    output_path = encrypt(tmp_path, plaintext, key=key, cipher=cipher)
+    header, frames, trailer = split_frames(output_path)
+    frame = bytearray(frames[1])
+    frame[len(frame) // 2] ^= 0x01
+    frames[1] = bytes(frame)
+    write_file(output_path, header + b''.join(frames) + trailer)
+    with pytest.raises(engine.DecryptionError):
+        engine.verify_file(output_path, key=key)
+    with EncryptedReader(output_path, key=key) as reader:
+        assert reader.read(0, CHUNK_SIZE) == plaintext[:CHUNK_SIZE]
+        with pytest.raises(engine.DecryptionError):
+            reader.read(CHUNK_SIZE, 1)
+
+
+def test_tampered_header_fails(tmp_path, key, plaintext):
+    output_path = encrypt(tmp_path, plaintext, key=key)
+    header, frames, trailer = split_frames(output_path)
+    metadata = json.loads(header[4:])
+    metadata['original_filename'] = 'other'
+    metadata_json = json.dumps(metadata).encode()
+    write_file(output_path, len(metadata_json).to_bytes(4, 'big') + metadata_json
+               + b''.join(frames) + trailer)
+    with pytest.raises(engine.DecryptionError):
+        engine.verify_file(output_path, key=key)
+
+
+@pytest.mark.parametrize('offset, length', [
+    (0, CHUNK_SIZE),
+    (CHUNK_SIZE - 1, 2),
+    (CHUNK_SIZE, CHUNK_SIZE),
+    (2 * CHUNK_SIZE - 1, CHUNK_SIZE + 2),
+    (3 * CHUNK_SIZE, 100),
+    (3 * CHUNK_SIZE + 50, 1000),
+    (3 * CHUNK_SIZE + 100, 10),
+    (0, None),
+])
+@pytest.mark.parametrize('cipher', engine.CIPHERS)
+def test_range_reads(tmp_path, key, plaintext, cipher, offset, length):
+    output_path = encrypt(tmp_path, plaintext, key=key, cipher=cipher, compress='zlib')
+    end = None if length is None else offset + length
+    assert read_range(output_path, offset, length, key=key) == plaintext[offset:end]
+
+
+def test_range_reads_reject_v1(tmp_path, key, plaintext):
+    path = write_v1(tmp_path / 'old.cyberph', plaintext, key)
+    with pytest.raises(engine.CyberPHError):
+        EncryptedReader(path, key=key)